@@ -0,0 +1,55 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+
+from utils import import_train_configuration, set_sumo, set_backend, build_simulation
+from gen_vp import TrafficGenerator
+
+
+def bench_steps(backend, sumo_cmd, max_steps):
+    """
+    Plain simulation steps without any query
+    """
+    backend.start(sumo_cmd)
+    start_time = timeit.default_timer()
+    for _ in range(max_steps):
+        backend.simulationStep()
+    elapsed = timeit.default_timer() - start_time
+    backend.close()
+    return max_steps / elapsed
+
+
+def bench_simulation(backend, config, sumo_cmd, max_steps):
+    """
+    One episode of the Simulation loop with random actions and no training
+    """
+    simulation = build_simulation(config, sumo_cmd=sumo_cmd, max_steps=max_steps, backend=backend)
+    # run rounds the simulation time it returns to 0.1 s
+    start_time = timeit.default_timer()
+    simulation.run(episode=0, epsilon=1.0)
+    return max_steps / (timeit.default_timer() - start_time)
+
+
+if __name__ == '__main__':
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps'])
+    max_steps = int(sys.argv[1]) if len(sys.argv) > 1 else config['max_steps']
+    TrafficGenerator(max_steps=config['max_steps'], n_cars_generated=config['n_cars_generated'],
+                     n_peds_generated=config['n_peds_generated']).generate_routefile(seed=0)
+
+    results = {}
+    for name in ['traci', 'libsumo']:
+        backend = set_backend(name)
+        if backend.__name__ != name:
+            continue
+        results[name] = (bench_steps(backend, sumo_cmd, max_steps),
+                         bench_simulation(backend, config, sumo_cmd, max_steps))
+
+    print('\n{:10s}{:>20s}{:>20s}'.format('backend', 'raw steps/s', 'Simulation steps/s'))
+    for name, (raw, simulation) in results.items():
+        print('{:10s}{:20.1f}{:20.1f}'.format(name, raw, simulation))
@@ -0,0 +1,132 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import csv
+import itertools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+
+from utils import import_train_configuration, set_backend, build_simulation
+from gen_vp import TrafficGenerator
+from profiler import Profiler
+
+# multiples of the cars and pedestrians of sim.ini
+LEVELS = [0.5, 1, 2, 5, 10]
+CSV_FIELDS = ['commit', 'backend', 'level', 'cars', 'peds', 'steps', 'steps_per_s', 'traci_share', 'encode_s',
+              'encode_us', 'traci_calls', 'avg_queue', 'peak_rss_mb', 'sumo_rss_mb']
+
+
+def run_level(config, backend_name, level, steps):
+    """
+    One episode of steps steps at level times the demand of sim.ini, the actions cycling through the phases
+    whatever the state, so that every commit runs the same simulation
+    :return: measurements of the episode
+    """
+    cars = int(round(config['n_cars_generated'] * level))
+    peds = int(round(config['n_peds_generated'] * level))
+    path = tempfile.mkdtemp()
+    profiler = Profiler(os.path.join(path, 'profile'))
+    simulation = build_simulation(
+        config, TrafficGen=TrafficGenerator(max_steps=config['max_steps'], n_cars_generated=cars, n_peds_generated=peds),
+        max_steps=steps, backend=set_backend(backend_name), route_file=os.path.join(path, 'routes.rou.xml'),
+        profiler=profiler,
+        # sumo is kept up after the episode to read its peak RSS
+        episodes_per_sumo=2
+    )
+    actions = itertools.cycle(range(config['num_actions'] - 1))
+    simulation._choose_action = lambda states, epsilon: next(actions)
+    simulation.run(episode=0, epsilon=0.0)
+    sumo_rss = sumo_peak_rss(simulation._conn)
+    simulation._close_sumo()
+
+    # run wrote the profile of the episode
+    rows = profiler._episodes[-1]['sections']
+    shutil.rmtree(path)
+    simulate_time = simulation._timings_store[-1]['simulate']
+    stats = simulation._get_episode_stats()
+    encode = [rows[section] for section in ['encode_veh', 'encode_ped'] if section in rows]
+    encode_time = sum(row['total_s'] for row in encode)
+    traci_time = sum(row['total_s'] for section, row in rows.items() if section.startswith('traci.'))
+    return {'backend': simulation._backend.__name__, 'level': level, 'cars': cars, 'peds': peds,
+            'steps': stats['steps'][-1], 'steps_per_s': stats['steps'][-1] / simulate_time,
+            'traci_share': traci_time / simulate_time, 'encode_s': encode_time,
+            'encode_us': encode_time / max(encode[0]['calls'], 1) * 1e6 if encode else 0.0,
+            'traci_calls': stats['traci_calls'][-1], 'avg_queue': stats['avg_queue_len'][-1],
+            # kB on linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 'sumo_rss_mb': sumo_rss}
+
+
+def sumo_peak_rss(conn):
+    """
+    Peak RSS in MB of the sumo process behind a traci connection, 0 for libsumo that runs inside this process.
+    RUSAGE_CHILDREN would count the copy of this process forked to start sumo
+    """
+    process = getattr(conn, '_process', None)
+    if process is None:
+        return 0.0
+    with open('/proc/{}/status'.format(process.pid)) as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def commit_id():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+if __name__ == '__main__':
+    # run from the repository root
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--levels', type=float, nargs='+', default=LEVELS, help='multiples of the demand of sim.ini')
+    parser.add_argument('--steps', type=int, default=1800, help='steps simulated at every level')
+    parser.add_argument('--backend', default='traci', help='traci or libsumo')
+    parser.add_argument('--csv', help='append the results to this file, tagged with the commit, to compare commits')
+    parser.add_argument('--level', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+
+    if args.level is not None:
+        # a single level in its own process, so that the peak RSS is the one of this level
+        print(json.dumps(run_level(config, args.backend, args.level, args.steps)))
+        sys.exit()
+
+    commit = commit_id()
+    results = []
+    for level in args.levels:
+        run = subprocess.run([sys.executable, os.path.abspath(__file__), '--level', str(level), '--steps',
+                              str(args.steps), '--backend', args.backend], capture_output=True, text=True)
+        if run.returncode != 0:
+            sys.exit('level {} failed:\n{}'.format(level, run.stderr))
+        result = json.loads(run.stdout.splitlines()[-1])
+        result['commit'] = commit
+        results.append(result)
+
+    print('\nCommit {}, {} steps with the {} backend and a fixed cycle of actions'.format(commit, args.steps,
+                                                                                         results[0]['backend']))
+    print('{:>6s}{:>7s}{:>7s}{:>9s}{:>9s}{:>10s}{:>11s}{:>10s}{:>11s}{:>10s}'.format(
+        'level', 'cars', 'peds', 'steps/s', 'traci %', 'encode s', 'encode us', 'queue', 'RSS MB', 'sumo MB'))
+    for result in results:
+        print('{:6.1f}{:7d}{:7d}{:9.0f}{:9.1f}{:10.2f}{:11.1f}{:10.1f}{:11.0f}{:10.0f}'.format(
+            result['level'], result['cars'], result['peds'], result['steps_per_s'], result['traci_share'] * 100,
+            result['encode_s'], result['encode_us'], result['avg_queue'], result['peak_rss_mb'],
+            result['sumo_rss_mb']))
+    if args.csv:
+        new_file = not os.path.exists(args.csv)
+        with open(args.csv, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(results)
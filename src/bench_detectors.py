@@ -0,0 +1,54 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+
+from utils import import_train_configuration, set_sumo, build_simulation
+
+
+def run_episode(config, sumo_cmd, seed, phase_jump, max_steps):
+    """
+    One episode with random actions and no training, stepped one by one or a phase at a time
+    :return: time of the episode, episode stats
+    """
+    simulation = build_simulation(config, sumo_cmd=sumo_cmd, max_steps=max_steps, phase_jump=phase_jump)
+    start_time = timeit.default_timer()
+    simulation.run(episode=seed, epsilon=1.0)
+    return timeit.default_timer() - start_time, simulation._get_episode_stats()
+
+
+if __name__ == '__main__':
+    # run from the repository root
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps'])
+    seeds = range(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
+    # the difference depends on the length of the episode
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else config['max_steps']
+
+    keys = ['reward', 'reward_veh', 'reward_ped', 'cumulative_wait', 'avg_queue_len', 'avg_ped_queue_len']
+    differences = {key: [] for key in keys}
+    times = {False: [], True: []}
+    calls = {False: [], True: []}
+    for seed in seeds:
+        stats = {}
+        for phase_jump in [False, True]:
+            elapsed, stats[phase_jump] = run_episode(config, sumo_cmd, seed, phase_jump, max_steps)
+            times[phase_jump].append(elapsed)
+            calls[phase_jump].append(stats[phase_jump]['traci_calls'][-1])
+        for key in keys:
+            step, jump = stats[False][key][-1], stats[True][key][-1]
+            differences[key].append((jump - step) / abs(step) if step else 0.0)
+
+    print('\nPhase jump against step by step over {} seeds of {} steps, random actions'.format(len(seeds), max_steps))
+    print('{:20s}{:>22s}{:>22s}'.format('stat', 'mean difference %', 'max |difference| %'))
+    for key in keys:
+        print('{:20s}{:22.2f}{:22.2f}'.format(key, 100 * sum(differences[key]) / len(seeds),
+                                              100 * max(abs(d) for d in differences[key])))
+    print('\n{:20s}{:>22s}{:>22s}'.format('mode', 'episode s', 'TraCI calls'))
+    for phase_jump, name in [(False, 'step by step'), (True, 'phase jump')]:
+        print('{:20s}{:22.1f}{:22.0f}'.format(name, sum(times[phase_jump]) / len(seeds),
+                                              sum(calls[phase_jump]) / len(seeds)))
@@ -0,0 +1,112 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import numpy as np
+
+from utils import import_train_configuration, build_simulation
+from fake_traci import FakeTraci, synthetic_frames, load_frames
+
+HOT_PATHS = ['_get_state', '_get_ped_state', '_collect_waiting_times', '_collect_ped_waiting_times', '_get_queue_length']
+AGENTS = [10, 100, 1000, 10000]
+
+
+def fake_simulation(config, frames, route_file):
+    """
+    Simulation started on a FakeTraci that replays frames, no sumo is needed
+    """
+    simulation = build_simulation(config, sumo_cmd=['sumo'], max_mem_size=1000, backend=FakeTraci(frames),
+                                  route_file=route_file)
+    simulation._start(0)
+    return simulation
+
+
+def bench_method(simulation, method, rounds):
+    """
+    Latency of rounds calls of method, every call on a new step as in the simulation loop
+    :return: per-call times in s
+    """
+    clock = timeit.default_timer
+    func = getattr(simulation, method)
+    times = np.empty(rounds)
+    for k in range(rounds):
+        simulation._traci.simulationStep()
+        simulation._agents._refresh()
+        start = clock()
+        func()
+        times[k] = clock() - start
+    return times
+
+
+def summary(times):
+    return {'min_us': times.min() * 1e6, 'median_us': float(np.median(times)) * 1e6, 'mean_us': times.mean() * 1e6,
+            'ops': 1 / times.mean()}
+
+
+def regressions(results, baseline, tolerance):
+    """
+    :param baseline: results of an earlier run, as written with --json
+    :return: the methods and populations whose median is more than tolerance slower than in baseline
+    """
+    slower = []
+    for method, populations in results.items():
+        for n, stats in populations.items():
+            # json keys are strings
+            reference = baseline.get(method, {}).get(str(n))
+            if reference is not None and stats['median_us'] > reference['median_us'] * (1 + tolerance):
+                slower.append('{} with {} agents: {:.1f} us, {:.1f} us in the baseline'.format(
+                    method, n, stats['median_us'], reference['median_us']))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type=int, default=200, help='calls timed per method and population')
+    parser.add_argument('--frames', help='frames recorded with fake_traci.record_frames instead of synthetic ones')
+    parser.add_argument('--json', help='write the results to this file, to be compared between runs')
+    parser.add_argument('--baseline', help='results of an earlier run written with --json, exit with an error if a '
+                                           'median is slower than there by more than the tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='slowdown allowed against the baseline')
+    args = parser.parse_args()
+
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    # the route file of the episode is generated as usual, sumo never reads it
+    route_dir = tempfile.mkdtemp()
+    route_file = os.path.join(route_dir, 'routes.rou.xml')
+    if args.frames:
+        recorded = load_frames(args.frames)
+        populations = [(max(len(vehicles) + len(persons) for vehicles, persons in recorded), recorded)]
+    else:
+        # two vehicles for every pedestrian
+        populations = [(n, synthetic_frames(n - n // 3, n // 3)) for n in AGENTS]
+
+    results = {}
+    for n, frames in populations:
+        simulation = fake_simulation(config, frames, route_file)
+        for method in HOT_PATHS:
+            results.setdefault(method, {})[n] = summary(bench_method(simulation, method, args.rounds))
+    shutil.rmtree(route_dir)
+
+    for method in HOT_PATHS:
+        print('\n' + method)
+        print('{:>8s}{:>12s}{:>12s}{:>12s}{:>12s}{:>10s}'.format('agents', 'min us', 'median us', 'mean us', 'ops/s',
+                                                                'scaling'))
+        first = next(iter(results[method].values()))['median_us']
+        for n, stats in results[method].items():
+            print('{:8d}{:12.1f}{:12.1f}{:12.1f}{:12.0f}{:10.1f}'.format(n, stats['min_us'], stats['median_us'],
+                                                                       stats['mean_us'], stats['ops'],
+                                                                       stats['median_us'] / first))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        if slower:
+            sys.exit('Slower than the baseline:\n' + '\n'.join(slower))
+        print('\nNo median slower than the baseline by more than {:.0%}'.format(args.tolerance))
@@ -0,0 +1,58 @@
+import os
+import sys
+import numpy as np
+import torch as T
+
+from utils import import_train_configuration, build_simulation
+from memory import Memory, CompactMemory, PrioritizedMemory
+
+
+def make_simulation(config, memory, fused_learning):
+    """
+    Simulation that is only used for its learner, sumo is never started
+    """
+    return build_simulation(config, Memory=memory, TrafficGen=None, sumo_cmd=None,
+                            training_epochs=config['training_epochs'], fused_learning=fused_learning)
+
+
+def fill(memory, config, transitions, seed=0):
+    """
+    Episodes of random binary states, 150 decisions each
+    """
+    rng = np.random.default_rng(seed)
+    state = None
+    for k in range(transitions):
+        if k % 150 == 0:
+            state = (rng.random(config['num_states']) < 0.1).astype(np.uint8)
+        new_state = (rng.random(config['num_states']) < 0.1).astype(np.uint8)
+        memory._store_transition(state, new_state, rng.integers(config['num_actions']), -rng.random() * 100,
+                                 -rng.random() * 90, -rng.random() * 10)
+        state = new_state
+    return memory
+
+
+def run(name, memory, config):
+    rates = []
+    for fused_learning in [False, True]:
+        T.manual_seed(0)
+        np.random.seed(0)
+        simulation = make_simulation(config, memory, fused_learning)
+        simulation._train()
+        rates.append(simulation._learner_steps_store[-1])
+    print('{:10s}{:20.1f}{:20.1f}{:10.2f}'.format(name, rates[0], rates[1], rates[1] / rates[0]))
+
+
+if __name__ == '__main__':
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    transitions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    memories = {
+        'uniform': Memory(config['num_states'], config['max_mem_size'], num_act=5),
+        'compact': CompactMemory(config['num_states'], config['max_mem_size'], num_act=5),
+        'per': PrioritizedMemory(config['num_states'], config['max_mem_size'], num_act=5, alpha=config['alpha'],
+                                 beta=config['beta'], beta_increment=config['beta_increment']),
+    }
+    print('{} epochs of {} transitions, {} transitions in memory'.format(
+        config['training_epochs'], config['batch_size'], transitions))
+    print('\n{:10s}{:>20s}{:>20s}{:>10s}'.format('memory', 'serial steps/s', 'fused steps/s', 'speedup'))
+    for name, memory in memories.items():
+        run(name, fill(memory, config, transitions), config)
@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import subprocess
+import timeit
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+from sumolib import checkBinary
+
+from gen_vp import TrafficGenerator
+from sumo_outputs import output_files, output_options, parse_tripinfo, RunningStats, TRIP_ATTRIBUTES
+
+
+def reference_tripinfo(filename):
+    """
+    parse_tripinfo on the whole tree loaded in memory
+    """
+    root = ET.parse(filename).getroot()
+    vehicles = RunningStats(TRIP_ATTRIBUTES)
+    persons = RunningStats(TRIP_ATTRIBUTES)
+    for element in root.iter('tripinfo'):
+        vehicles._add(element)
+    for element in root.iter('personinfo'):
+        persons._add(element)
+    result = vehicles._result('veh')
+    result.update(persons._result('ped'))
+    result['veh_unfinished'] = sum(1 for element in root.iter('tripinfo') if element.get('vaporized') == 'end')
+    return result
+
+
+def scale_tripinfo(filename, scaled_filename, copies):
+    """
+    A tripinfo file with every trip repeated copies times, as a much larger demand would write
+    """
+    with open(filename) as f:
+        lines = f.readlines()
+    start = next(i for i, line in enumerate(lines) if line.lstrip().startswith('<tripinfos'))
+    end = next(i for i, line in enumerate(lines) if line.lstrip().startswith('</tripinfos'))
+    with open(scaled_filename, 'w') as f:
+        f.writelines(lines[:start + 1])
+        for _ in range(copies):
+            f.writelines(lines[start + 1:end])
+        f.writelines(lines[end:])
+
+
+def measure(parse, filename):
+    """
+    :return: result, time in s and peak of the python allocations in MB
+    """
+    tracemalloc.start()
+    start_time = timeit.default_timer()
+    result = parse(filename)
+    elapsed = timeit.default_timer() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1e6
+
+
+if __name__ == '__main__':
+    # run from the repository root, outputs are written under intersection/
+    copies = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    TrafficGenerator(max_steps=5400, n_cars_generated=1000, n_peds_generated=500).generate_routefile(seed=0)
+    files = output_files('intersection', 'bench')
+    subprocess.run([checkBinary('sumo'), '-c', os.path.join('intersection', 'scenario.sumocfg.xml'), '--no-step-log',
+                    '--no-warnings', '--end', '5400'] + output_options(files), check=True)
+    scaled_file = os.path.join('intersection', 'tripinfo_scaled.xml')
+    scale_tripinfo(files['tripinfo'], scaled_file, copies)
+
+    print('\n{:12s}{:>10s}{:>12s}{:>12s}{:>16s}'.format('parser', 'copies', 'file MB', 'time s', 'peak memory MB'))
+    for filename, n in [(files['tripinfo'], 1), (scaled_file, copies)]:
+        streamed, streamed_time, streamed_peak = measure(parse_tripinfo, filename)
+        loaded, loaded_time, loaded_peak = measure(reference_tripinfo, filename)
+        if streamed != loaded:
+            sys.exit('The streaming parser differs from the parser of the whole tree')
+        size = os.path.getsize(filename) / 1e6
+        print('{:12s}{:10d}{:12.1f}{:12.2f}{:16.1f}'.format('iterparse', n, size, streamed_time, streamed_peak))
+        print('{:12s}{:10d}{:12.1f}{:12.2f}{:16.1f}'.format('whole tree', n, size, loaded_time, loaded_peak))
+    for filename in list(files.values()) + [scaled_file]:
+        os.remove(filename)
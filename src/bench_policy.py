@@ -0,0 +1,77 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import os
+import sys
+import threading
+import timeit
+import numpy as np
+import torch as T
+
+from utils import import_train_configuration, build_network
+from policy import GreedyPolicy
+
+
+def reference_action(network, lock, states):
+    """
+    The greedy branch of Simulation._choose_action before GreedyPolicy
+    """
+    state = T.tensor(states[np.newaxis]).to(network.device)
+    with lock:
+        actions = network.forward(state.float())
+    return T.argmax(actions).item()
+
+
+def latencies(choose, states, warm_up=50):
+    """
+    :return: actions chosen for states and the time of every decision in s
+    """
+    clock = timeit.default_timer
+    for state in states[:warm_up]:
+        choose(state)
+    actions = np.empty(len(states), dtype=np.int64)
+    times = np.empty(len(states))
+    for k, state in enumerate(states):
+        start = clock()
+        actions[k] = choose(state)
+        times[k] = clock() - start
+    return actions, times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--decisions', type=int, default=5000, help='decisions timed per variant')
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, T.get_num_threads()}),
+                        help='torch thread counts to compare')
+    args = parser.parse_args()
+
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    network = build_network(config)
+    # occupancy states as StateEncoder writes them
+    states = np.random.default_rng(0).integers(0, 2, size=(args.decisions, config['num_states']), dtype=np.uint8)
+    lock = threading.Lock()
+    eager = GreedyPolicy(network)
+    script = GreedyPolicy(network, script=True)
+
+    def with_lock(policy):
+        def choose(state):
+            with lock:
+                return policy._act(state)
+        return choose
+
+    variants = [('reference', lambda state: reference_action(network, lock, state)),
+                ('inference', with_lock(eager)), ('torchscript', with_lock(script))]
+    print('\n{:>8s}{:>13s}{:>10s}{:>10s}{:>10s}{:>10s}'.format('threads', 'variant', 'p50 us', 'p99 us', 'mean us',
+                                                               'speedup'))
+    for threads in args.threads:
+        T.set_num_threads(threads)
+        reference_actions, reference_times = None, None
+        for name, choose in variants:
+            actions, times = latencies(choose, states)
+            if reference_actions is None:
+                reference_actions, reference_times = actions, times
+            elif not np.array_equal(actions, reference_actions):
+                sys.exit('{} chooses other actions than the reference'.format(name))
+            print('{:8d}{:>13s}{:10.1f}{:10.1f}{:10.1f}{:10.2f}'.format(
+                threads, name, np.percentile(times, 50) * 1e6, np.percentile(times, 99) * 1e6, times.mean() * 1e6,
+                np.median(reference_times) / np.median(times)))
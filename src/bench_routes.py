@@ -0,0 +1,115 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+import math
+import subprocess
+import timeit
+import xml.etree.ElementTree as ET
+import numpy as np
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+from sumolib import checkBinary
+
+from gen_vp import TrafficGenerator, ROUTES_HEADER, STRAIGHT_WALKS, DIAGONAL_WALKS
+
+PED_VTYPE = '    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n'
+
+
+def reference_routefile(generator, seed, route_file):
+    """
+    The generation as it was in TrafficGenerator.generate_routefile: np.append in a loop, one vType and
+    four print calls per pedestrian
+    """
+    np.random.seed(seed)
+    timings = np.random.weibull(2, generator._n_cars_generated)
+    ped_timings = np.random.uniform(2, generator._n_peds_generated, generator._n_peds_generated)
+    timings = np.sort(timings)
+    ped_timings = np.sort(ped_timings)
+
+    car_gen_steps = []
+    min_old = math.floor(timings[1])
+    max_old = math.ceil(timings[-1])
+    for value in timings:
+        car_gen_steps = np.append(car_gen_steps, ((generator._max_steps - 0) / (max_old - min_old)) * (value - max_old) + generator._max_steps)
+
+    ped_gen_steps = []
+    min_old_ped = math.floor(ped_timings[1])
+    max_old_ped = math.ceil(ped_timings[-1])
+    max_new_ped = generator._max_steps - 1400
+    for val in ped_timings:
+        ped_gen_steps = np.append(ped_gen_steps, ((max_new_ped - 0) / (max_old_ped - min_old_ped)) * (val - max_old_ped) + max_new_ped)
+    ped_gen_steps = np.rint(ped_gen_steps)
+    ped_gen_steps[0] = 0
+
+    with open(route_file, "w") as routes:
+        print(ROUTES_HEADER.replace(ROUTES_HEADER.splitlines()[5] + '\n', ''), file=routes)
+        for ped_counter, p_step in enumerate(ped_gen_steps):
+            diag_ped = np.random.randint(0, 100)
+            if diag_ped <= 72:
+                if p_step <= 0:
+                    p_step = 0.0
+                walk = STRAIGHT_WALKS[np.random.randint(1, 9)]
+            else:
+                walk = DIAGONAL_WALKS[np.random.randint(1, 9)]
+            print(PED_VTYPE % ped_counter, file=routes)
+            print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
+            print('        <walk from="%s" to="%s" arrivalPos="-1"/>\n' % walk, file=routes)
+            print('    </person>\n', file=routes)
+        print("</routes>", file=routes)
+
+
+def semantic_content(route_file):
+    """
+    Every element of the route file with its attributes, the type of a person replaced by the attributes of its vType
+    """
+    root = ET.parse(route_file).getroot()
+    vtypes = {vtype.get('id'): vtype.attrib for vtype in root.iter('vType')}
+    content = []
+    for element in root:
+        if element.tag == 'vType' and element.get('vClass') == 'pedestrian':
+            continue
+        attributes = dict(element.attrib)
+        if element.tag == 'person':
+            attributes['type'] = sorted((k, v) for k, v in vtypes[attributes['type']].items() if k != 'id')
+        content.append((element.tag, sorted(attributes.items()), [sorted(child.attrib.items()) for child in element]))
+    return content
+
+
+def check_equivalence(generator, seeds=range(20)):
+    for seed in seeds:
+        reference_routefile(generator, seed, 'intersection/reference_routes.rou.xml')
+        reference_rng = np.random.get_state()
+        generator.generate_routefile(seed, 'intersection/vectorized_routes.rou.xml')
+        rng = np.random.get_state()
+        if semantic_content('intersection/reference_routes.rou.xml') != semantic_content('intersection/vectorized_routes.rou.xml'):
+            sys.exit('The routes of seed {} differ from the reference generation'.format(seed))
+        if reference_rng[2] != rng[2] or not np.array_equal(reference_rng[1], rng[1]):
+            sys.exit('The random state after seed {} differs from the reference generation'.format(seed))
+    print('Route files match the reference generation for {} seeds'.format(len(seeds)))
+
+
+def sumo_load_time(route_file, number=5):
+    """
+    Time to start sumo, load the network and the routes and simulate one step
+    """
+    cmd = [checkBinary('sumo'), '-c', os.path.join('intersection', 'scenario.sumocfg.xml'), '-r', route_file,
+           '--end', '1', '--no-step-log', '--no-warnings']
+    return min(timeit.repeat(lambda: subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL), number=1, repeat=number))
+
+
+if __name__ == '__main__':
+    # run from the repository root, route files are written under intersection/
+    generator = TrafficGenerator(max_steps=5400, n_cars_generated=1000, n_peds_generated=500)
+    check_equivalence(generator)
+
+    print('\n{:12s}{:>18s}{:>14s}{:>18s}'.format('generator', 'generation ms', 'file KB', 'sumo load ms'))
+    for name, route_file, generate in [
+            ('reference', 'intersection/reference_routes.rou.xml', lambda: reference_routefile(generator, 0, 'intersection/reference_routes.rou.xml')),
+            ('vectorized', 'intersection/vectorized_routes.rou.xml', lambda: generator.generate_routefile(0, 'intersection/vectorized_routes.rou.xml'))]:
+        generation_time = min(timeit.repeat(generate, number=1, repeat=20))
+        print('{:12s}{:18.2f}{:14.1f}{:18.1f}'.format(name, generation_time * 1e3, os.path.getsize(route_file) / 1e3,
+                                                     sumo_load_time(route_file) * 1e3))
+    for route_file in ['intersection/reference_routes.rou.xml', 'intersection/vectorized_routes.rou.xml']:
+        os.remove(route_file)
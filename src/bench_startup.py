@@ -0,0 +1,47 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import sys
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+
+import numpy as np
+from utils import import_train_configuration, set_sumo, set_backend, build_simulation
+
+
+def run_episodes(backend, config, sumo_cmd, episodes, max_steps, episodes_per_sumo):
+    """
+    Short episodes with random actions and no training
+    :return: startup time of every episode, episode stats
+    """
+    simulation = build_simulation(config, sumo_cmd=sumo_cmd, max_steps=max_steps, backend=backend,
+                                  episodes_per_sumo=episodes_per_sumo)
+    for episode in range(episodes):
+        simulation.run(episode=episode, epsilon=1.0)
+    simulation._close_sumo()
+    return simulation._startup_time_store, simulation._get_episode_stats()
+
+
+if __name__ == '__main__':
+    # run from the repository root
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    sumo_cmd = set_sumo(False, config['sumocfg_file_name'], config['max_steps'])
+    episodes = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    results = []
+    for name in ['traci', 'libsumo']:
+        backend = set_backend(name)
+        if backend.__name__ != name:
+            continue
+        fresh_times, fresh_stats = run_episodes(backend, config, sumo_cmd, episodes, max_steps, 1)
+        reused_times, reused_stats = run_episodes(backend, config, sumo_cmd, episodes, max_steps, episodes)
+        if fresh_stats != reused_stats:
+            sys.exit('Episodes run in a reused sumo differ from episodes run in a new sumo')
+        results.append((name, np.mean(fresh_times), np.mean(reused_times[1:])))
+
+    print('\nSame episode stats with and without reuse, {} episodes of {} steps'.format(episodes, max_steps))
+    print('{:10s}{:>22s}{:>22s}'.format('backend', 'start per episode ms', 'load per episode ms'))
+    for name, fresh, reused in results:
+        print('{:10s}{:22.1f}{:22.1f}'.format(name, fresh * 1e3, reused * 1e3))
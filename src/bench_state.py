@@ -0,0 +1,25 @@
+import os
+import sys
+import timeit
+import numpy as np
+
+from state_encoder import StateEncoder
+
+# the reference encoding is the oracle of the tests, it is kept with them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests'))
+from reference_encoder import reference_state, reference_ped_state, random_agents
+
+
+def run(n_veh, n_ped, number=200):
+    vehicles, persons = random_agents(np.random.default_rng(1), n_veh, n_ped)
+    encoder = StateEncoder()
+    t_ref = timeit.timeit(lambda: reference_state(vehicles) + reference_ped_state(persons), number=number) / number
+    t_enc = timeit.timeit(lambda: encoder.encode(vehicles, persons), number=number) / number
+    print('vehicles:{:6d} pedestrians:{:6d} - reference: {:8.1f}us - encoder: {:8.1f}us - x{:.1f}'.format(
+        n_veh, n_ped, t_ref * 1e6, t_enc * 1e6, t_ref / t_enc))
+
+
+if __name__ == '__main__':
+    # the equivalence with the reference encoding is checked by tests/test_state_encoder.py
+    for n_veh, n_ped in [(10, 5), (100, 50), (1000, 500), (10000, 5000)]:
+        run(n_veh, n_ped)
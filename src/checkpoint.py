@@ -0,0 +1,110 @@
+import os
+import json
+import queue
+import random
+import threading
+import numpy as np
+import torch as T
+
+
+class Checkpointer:
+    """
+    Writes the full training state (networks, optimizer, memory, episode, rng states and episode stats) on a
+    background thread. The last keep_last checkpoints and the keep_best ones with the highest episode reward
+    are kept, the others are removed
+    """
+    def __init__(self, path, interval, keep_last, keep_best):
+        self._path = path
+        self._interval = interval
+        self._keep_last = keep_last
+        self._keep_best = keep_best
+        os.makedirs(path, exist_ok=True)
+        # checkpoint filename -> (episode, reward) of the checkpoints on disk
+        self._index_file = os.path.join(path, 'checkpoints.json')
+        self._index = {}
+        if os.path.exists(self._index_file):
+            with open(self._index_file) as f:
+                self._index = json.load(f)
+        # episode of the last checkpoint, episodes advance by the number of environments and may skip a multiple
+        # of interval
+        self._last_episode = max([entry[0] for entry in self._index.values()], default=0)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def _save(self, episode, epsilon, simulation, memory, final=False):
+        """
+        Snapshot the training state once the episode before episode is done, the copy is written in the background.
+        A checkpoint is taken when episode reaches a new multiple of interval, and after the final episode
+        :param episode: first episode to run when resuming from this checkpoint
+        """
+        if self._interval == 0 or episode == self._last_episode:
+            return
+        if not final and episode // self._interval == self._last_episode // self._interval:
+            return
+        self._last_episode = episode
+        state = {'episode': episode,
+                 'epsilon': epsilon,
+                 'simulation': simulation._training_state(),
+                 'memory': memory._state_dict(),
+                 'rng': {'numpy': np.random.get_state(), 'random': random.getstate(), 'torch': T.get_rng_state(),
+                         'cuda': T.cuda.get_rng_state_all() if T.cuda.is_available() else None}}
+        reward = float(simulation._get_episode_stats()['reward'][-1])
+        self._queue.put((state, reward))
+
+    def _load(self, simulation, memory):
+        """
+        Restore the last checkpoint
+        :return: the episode to continue from, 0 if there is no checkpoint
+        """
+        if not self._index:
+            return 0
+        filename = max(self._index, key=lambda name: self._index[name][0])
+        state = T.load(os.path.join(self._path, filename), map_location=simulation.qnet_local.device,
+                       weights_only=False)
+        simulation._load_training_state(state['simulation'])
+        memory._load_state_dict(state['memory'])
+        np.random.set_state(state['rng']['numpy'])
+        random.setstate(state['rng']['random'])
+        T.set_rng_state(state['rng']['torch'])
+        if state['rng']['cuda'] is not None and T.cuda.is_available():
+            T.cuda.set_rng_state_all(state['rng']['cuda'])
+        self._last_episode = state['episode']
+        print('Resuming from', os.path.join(self._path, filename), '- episode', state['episode'] + 1)
+        return state['episode']
+
+    def _close(self):
+        """
+        Wait for the checkpoints that are not written yet
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            state, reward = item
+            filename = 'checkpoint_{:06d}.pth'.format(state['episode'])
+            # written under a temporary name first, a crash while writing leaves the previous checkpoints intact
+            tmp_file = os.path.join(self._path, filename + '.tmp')
+            T.save(state, tmp_file)
+            os.replace(tmp_file, os.path.join(self._path, filename))
+            self._index[filename] = (state['episode'], reward)
+            self._retain()
+
+    def _retain(self):
+        """
+        Remove the checkpoints that are neither among the last keep_last nor among the best keep_best
+        """
+        by_episode = sorted(self._index, key=lambda name: self._index[name][0], reverse=True)
+        by_reward = sorted(self._index, key=lambda name: self._index[name][1], reverse=True)
+        keep = set(by_episode[:self._keep_last]) | set(by_reward[:self._keep_best])
+        for filename in set(self._index) - keep:
+            del self._index[filename]
+            os.remove(os.path.join(self._path, filename))
+        tmp_file = self._index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self._index, f)
+        os.replace(tmp_file, self._index_file)
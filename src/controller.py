@@ -0,0 +1,200 @@
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import argparse
+import csv
+import timeit
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import numpy as np
+import torch as T
+
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
+import traci
+
+from utils import import_train_configuration, set_sumo, build_network
+from gen_vp import TrafficGenerator
+from policy import GreedyPolicy
+from subscription import AgentCache
+from state_encoder import StateEncoder
+from fake_traci import FakeTraci, synthetic_frames, load_frames
+from simulation import PHASE_EW_GREEN, PHASE_NS_GREEN, PHASE_EWV_GREEN, PHASE_NSV_GREEN, PHASE_P_GREEN
+
+GREEN_PHASES = {0: PHASE_EW_GREEN, 1: PHASE_NS_GREEN, 2: PHASE_EWV_GREEN, 3: PHASE_NSV_GREEN, 4: PHASE_P_GREEN}
+LATENCY_FIELDS = ['decision', 'time', 'action', 'fallback', 'observe_us', 'policy_us', 'latency_us']
+
+
+def load_network(filename, config):
+    """
+    DeepQNetwork with the weights of a state_dict file (trained_model_state.pth) or of the local network of a
+    training checkpoint
+    """
+    network = build_network(config)
+    # checkpoints hold the random states next to the tensors
+    state = T.load(filename, map_location=network.device, weights_only=False)
+    if 'simulation' in state:
+        state = state['simulation']['qnet_local']
+    network.load_state_dict(state)
+    network.requires_grad_(False)
+    return network.eval()
+
+
+class Controller:
+    """
+    Drives the traffic light "C" of a sumo with the greedy policy of a trained network, without exploration,
+    memory or learning. Every decision observes the intersection, chooses the next phase and runs it, through
+    the same yellow phases as Simulation._act, with one simulationStep per phase.
+    The policy runs on a worker thread with a hard deadline counted from the start of the decision: when the
+    action is not there in time, the fixed-time plan is followed instead, which moves on to the phase after the
+    current one in the order of the actions
+    """
+    def __init__(self, conn, network, deadline, green_duration, ped_green_duration, yellow_duration,
+                 ped_yellow_duration, num_states_veh, num_states, num_fixed_actions, script=False):
+        self._conn = conn
+        self._policy = GreedyPolicy(network, script=script)
+        self._deadline = deadline
+        self._green_duration = green_duration
+        self._ped_green_duration = ped_green_duration
+        self._yellow_duration = yellow_duration
+        self._ped_yellow_duration = ped_yellow_duration
+        self._num_fixed_actions = num_fixed_actions
+        self._agents = AgentCache()
+        self._encoder = StateEncoder(num_states_veh=num_states_veh, num_states_ped=num_states - num_states_veh)
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        # a late decision keeps the worker busy, the next decisions fall back until it is done
+        self._pending = None
+        self._old_action = -1
+        self._time = 0
+        self._latency_store = []
+
+    def run(self, max_steps, attached=False):
+        """
+        Control the traffic light for max_steps seconds from the current time, or until nothing is left to simulate
+        :param attached: the controller attached to a sumo that is already running, with agents in it
+        :return: per-decision latencies
+        """
+        self._time = int(self._conn.simulation.getTime())
+        # a sumo that already ran has agents before the next step, the first decision must see them
+        self._agents._subscribe(self._conn, loaded_state=attached or self._time > 0)
+        end = self._time + max_steps
+        decision = 0
+        while self._time < end and self._conn.simulation.getMinExpectedNumber() > 0:
+            self._act(self._decide(decision), end)
+            decision += 1
+        self._worker.shutdown(wait=True)
+        return self._latency_store
+
+    def _decide(self, decision):
+        """
+        Greedy action for the current state, or the action of the fixed-time plan if the deadline is missed
+        """
+        clock = timeit.default_timer
+        start = clock()
+        state = np.concatenate((self._encoder.encode_veh(list(self._agents.vehicles().values())),
+                                self._encoder.encode_ped(list(self._agents.persons().values()))))
+        observed = clock()
+        action = None
+        if self._pending is None or self._pending.done():
+            self._pending = self._worker.submit(self._policy._act, state)
+            try:
+                action = self._pending.result(timeout=max(self._deadline - (observed - start), 0))
+            except TimeoutError:
+                pass
+        decided = clock()
+        fallback = action is None
+        if fallback:
+            action = (self._old_action + 1) % self._num_fixed_actions
+        self._latency_store.append({'decision': decision, 'time': self._time, 'action': action,
+                                    'fallback': int(fallback), 'observe_us': (observed - start) * 1e6,
+                                    'policy_us': (decided - observed) * 1e6, 'latency_us': (decided - start) * 1e6})
+        return action
+
+    def _act(self, action, end):
+        """
+        Run the yellow phases from the previous action, if it changes, then the green phase of action
+        """
+        old_action = self._old_action
+        if old_action >= 0 and old_action != action:
+            if old_action == 0 or old_action == 1:
+                self._run_phase(old_action + 1, self._ped_yellow_duration, end)
+                self._run_phase(old_action + 2, self._yellow_duration, end)
+            elif old_action == 5:
+                self._run_phase(old_action * 2 + 3, self._ped_yellow_duration, end)
+            else:
+                self._run_phase(old_action * 2 + 3, self._yellow_duration, end)
+        # action 5 keeps the phase the light is in, as in Simulation._set_green_phase
+        self._run_phase(GREEN_PHASES.get(action),
+                        self._ped_green_duration if action == 5 else self._green_duration, end)
+        self._old_action = action
+
+    def _run_phase(self, phase, duration, end):
+        if phase is not None:
+            self._conn.trafficlight.setPhase("C", phase)
+        steps = min(duration, end - self._time)
+        if steps <= 0:
+            return
+        self._conn.simulationStep(self._time + steps)
+        self._agents._refresh()
+        self._time += steps
+
+
+def latency_summary(latencies):
+    times = np.array([row['latency_us'] for row in latencies])
+    return {'decisions': len(latencies), 'fallbacks': sum(row['fallback'] for row in latencies),
+            'p50_us': float(np.percentile(times, 50)), 'p99_us': float(np.percentile(times, 99)),
+            'max_us': float(times.max())}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Control the traffic light of the scramble crossing with a trained '
+                                                 'policy')
+    parser.add_argument('model', help='trained_model_state.pth of a training, or one of its checkpoints')
+    parser.add_argument('--port', type=int, help='attach to the sumo listening on this port instead of starting one')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--order', type=int, help='client order, when other clients are attached to the same sumo')
+    parser.add_argument('--fake', nargs='?', const='', metavar='FRAMES',
+                        help='replay FakeTraci frames recorded with fake_traci.record_frames, synthetic ones without '
+                             'a file, instead of a sumo')
+    parser.add_argument('--seed', type=int, default=0, help='routes of the sumo started by the controller')
+    parser.add_argument('--steps', type=int, help='simulation time to control, max_steps of sim.ini by default')
+    parser.add_argument('--deadline-ms', type=float, default=50.0,
+                        help='time a decision may take before the fixed-time plan is followed')
+    parser.add_argument('--script', action='store_true', help='run the policy through a TorchScript trace')
+    parser.add_argument('--latency-csv', help='write the per-decision latencies to this file')
+    args = parser.parse_args()
+
+    config = import_train_configuration(config_file=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim.ini'))
+    max_steps = args.steps or config['max_steps']
+    if args.port is not None:
+        traci.init(port=args.port, host=args.host, label='controller')
+        conn = traci.getConnection('controller')
+        if args.order is not None:
+            conn.setOrder(args.order)
+    elif args.fake is not None:
+        conn = FakeTraci(load_frames(args.fake) if args.fake else synthetic_frames(200, 100))
+        conn.start(['sumo'])
+    else:
+        # run from the repository root, as train_main
+        TrafficGenerator(max_steps=config['max_steps'], n_cars_generated=config['n_cars_generated'],
+                         n_peds_generated=config['n_peds_generated']).generate_routefile(seed=args.seed)
+        traci.start(set_sumo(config['gui'], config['sumocfg_file_name'], max_steps), label='controller')
+        conn = traci.getConnection('controller')
+
+    controller = Controller(conn, load_network(args.model, config), deadline=args.deadline_ms / 1e3,
+                            green_duration=config['green_duration'], ped_green_duration=config['ped_green_duration'],
+                            yellow_duration=config['yellow_duration'],
+                            ped_yellow_duration=config['ped_yellow_duration'], num_states_veh=config['num_state_veh'],
+                            num_states=config['num_states'], num_fixed_actions=config['num_actions'] - 1,
+                            script=args.script)
+    latencies = controller.run(max_steps, attached=args.port is not None)
+    conn.close()
+
+    summary = latency_summary(latencies)
+    print('Decisions:', summary['decisions'], '- deadline missed:', summary['fallbacks'],
+          '- latency p50: {:.0f} us, p99: {:.0f} us, max: {:.0f} us'.format(summary['p50_us'], summary['p99_us'],
+                                                                           summary['max_us']))
+    if args.latency_csv:
+        with open(args.latency_csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=LATENCY_FIELDS)
+            writer.writeheader()
+            writer.writerows(latencies)
@@ -0,0 +1,43 @@
+import os
+
+DETECTORS_FILE = os.path.join('intersection', 'detectors.add.xml')
+
+# id of the edgeData that sums the halting vehicles of the incoming edges over the steps
+APPROACH_DATA = 'approach'
+APPROACH_EDGES = ['N2TL', 'NN2TL', 'S2TL', 'SS2TL', 'E2TL', 'EE2TL', 'W2TL', 'WW2TL']
+# times every edge is counted in Simulation._get_queue_length, where the east approach counts NN2TL again
+QUEUE_WEIGHTS = {'N2TL': 1, 'NN2TL': 2, 'S2TL': 1, 'SS2TL': 1, 'E2TL': 1, 'EE2TL': 0, 'W2TL': 1, 'WW2TL': 1}
+
+# counter of the emergency stops since the start of the simulation
+EMERGENCY_STOPS = 'stats.safety.emergencyStops'
+
+DETECTORS = """<?xml version="1.0" encoding="UTF-8"?>
+<additional>
+    <edgeData id="%s" edges="%s" file="NUL"/>
+</additional>
+"""
+
+
+def write_detectors(add_file=DETECTORS_FILE):
+    """
+    Write the additional file with the detectors that let Simulation advance a whole phase in one step.
+
+    The edgeData sums, over the steps, the vehicles halting (speed < 0.1) on the incoming edges, which is the
+    queue length that _simulate adds up step by step. Its waitingTime is readable while the interval is still
+    running, so the sum over a phase is the difference of two reads. Unlike the halting number of an edge it
+    also counts the vehicles that halt with their back on the edge and their front further on, in the junction
+    or on the next edge. Once the queues reach the ends of the edges that is about one vehicle-step per edge
+    and step, so the queue sums and cumulative_wait come out higher, the more so the shorter the episode.
+    Measured with bench_detectors.py (random actions, 5 seeds): +8.2% on average and at most +8.7% over 1500
+    steps, +5.0% on average and at most +5.5% over the 5400 steps of sim.ini. Lane-area and entry-exit
+    detectors only give last step or mean values over TraCI, not sums, and are not used.
+    The emergency stops are read from a counter of sumo and stay exact, and so does the vehicle reward, which
+    is read at the decisions. The pedestrians need no detector: their waiting time runs on while they stand
+    in a waiting area, so the waits of the skipped steps follow from the last one (see
+    Simulation._accumulate_ped_waiting_times). Pedestrians that wait, move up and wait again, or wait and
+    leave within a phase are missed: over the same runs the pedestrian reward is at most 4.8% (1500 steps)
+    and 2.4% (5400 steps) off, and the pedestrian queue about 3% lower (at most 3.6%)
+    """
+    edges = ' '.join(APPROACH_EDGES)
+    with open(add_file, 'w') as detectors:
+        detectors.write(DETECTORS % (APPROACH_DATA, edges))
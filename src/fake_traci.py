@@ -0,0 +1,231 @@
+import pickle
+import numpy as np
+import traci.constants as tc
+
+from detectors import APPROACH_EDGES
+
+# lanes of scenario_scramble.net.xml: incoming lanes, outgoing and internal lanes. The x2TL_0 lanes next to the
+# crossings are sidewalks and left out, the outer xx2TL edges have no sidewalk, their lanes 0-2 carry vehicles
+VEH_LANES = ['W2TL_1', 'W2TL_2', 'W2TL_3', 'WW2TL_0', 'WW2TL_1', 'WW2TL_2',
+             'N2TL_1', 'N2TL_2', 'N2TL_3', 'NN2TL_0', 'NN2TL_1', 'NN2TL_2',
+             'E2TL_1', 'E2TL_2', 'E2TL_3', 'EE2TL_0', 'EE2TL_1', 'EE2TL_2',
+             'S2TL_1', 'S2TL_2', 'S2TL_3', 'SS2TL_0', 'SS2TL_1', 'SS2TL_2',
+             'TL2E_1', 'TL2N_2', 'TL2W_3', 'TL2SS_1', ':TL_1_0', ':TL_9_0', ':TL_16_2']
+# (lane id, length) of the lanes the pedestrians walk on: waiting areas, crossings and sidewalks
+PED_LANES = [(':TL_w0_0', 12), (':TL_w1_0', 12), (':TL_w2_0', 12), (':TL_w3_0', 12),
+             (':TL_c0_0', 28), (':TL_c1_0', 16), (':TL_c2_0', 28), (':TL_c3_0', 16), (':TL_c4_0', 16),
+             (':TL_c5_0', 16), ('S2TL_0', 100), ('N2TL_0', 100), ('TL2E_0', 100), ('TL2W_0', 100)]
+VEH_LANE_LENGTH = 100
+
+
+def road_id(lane_id):
+    return lane_id.rsplit('_', 1)[0]
+
+
+def synthetic_frames(n_vehicles, n_persons, n_frames=50, seed=0):
+    """
+    Frames with n_vehicles vehicles and n_persons pedestrians at random positions, the same ids in every frame
+    :return: list of (vehicles, persons), vehicle id -> (lane id, lane position, road id, accumulated waiting
+             time, speed), person id -> (lane id, lane position, waiting time)
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n_frames):
+        lanes = rng.integers(len(VEH_LANES), size=n_vehicles).tolist()
+        positions = rng.uniform(0.01, VEH_LANE_LENGTH - 1.5, size=n_vehicles).tolist()
+        waits = rng.integers(0, 300, size=n_vehicles).astype(float).tolist()
+        speeds = np.where(rng.random(n_vehicles) < 0.5, 0.0, rng.uniform(0.1, 14, size=n_vehicles)).tolist()
+        vehicles = {'v%i' % k: (VEH_LANES[lane], pos, road_id(VEH_LANES[lane]), wait, speed)
+                    for k, (lane, pos, wait, speed) in enumerate(zip(lanes, positions, waits, speeds))}
+        lanes = rng.integers(len(PED_LANES), size=n_persons).tolist()
+        fractions = rng.random(n_persons).tolist()
+        waits = np.where(rng.random(n_persons) < 0.5, 0.0, rng.integers(1, 120, size=n_persons)).tolist()
+        persons = {'p%i' % k: (PED_LANES[lane][0], fraction * PED_LANES[lane][1], wait)
+                   for k, (lane, fraction, wait) in enumerate(zip(lanes, fractions, waits))}
+        frames.append((vehicles, persons))
+    return frames
+
+
+def record_frames(conn, steps):
+    """
+    Frames of the next steps of the sumo behind the traci connection conn
+    """
+    frames = []
+    for _ in range(steps):
+        conn.simulationStep()
+        vehicles = {veh_id: (conn.vehicle.getLaneID(veh_id), conn.vehicle.getLanePosition(veh_id),
+                             conn.vehicle.getRoadID(veh_id), conn.vehicle.getAccumulatedWaitingTime(veh_id),
+                             conn.vehicle.getSpeed(veh_id))
+                    for veh_id in conn.vehicle.getIDList()}
+        persons = {ped_id: (conn.person.getLaneID(ped_id), conn.person.getLanePosition(ped_id),
+                            conn.person.getWaitingTime(ped_id))
+                   for ped_id in conn.person.getIDList()}
+        frames.append((vehicles, persons))
+    return frames
+
+
+def save_frames(frames, filename):
+    with open(filename, 'wb') as f:
+        pickle.dump(frames, f)
+
+
+def load_frames(filename):
+    with open(filename, 'rb') as f:
+        return pickle.load(f)
+
+
+class FakeTraci:
+    """
+    In-process stand-in for the traci module, to run the hot paths of Simulation without sumo. It is passed
+    as backend=FakeTraci(frames), like libsumo.
+    It replays frames, the vehicles and pedestrians of one step each, synthetic (synthetic_frames) or recorded
+    from a real sumo (record_frames), moving to the next one at every step and starting over after the last.
+    It answers the calls Simulation makes: the subscriptions of AgentCache, the halting numbers of the
+    edges, the emergency stops, the traffic light and the edgeData of detectors.py. The answers of every frame
+    are prepared up front, so that the time measured is the time of the caller
+    """
+    def __init__(self, frames):
+        self._frames = [self._prepare(vehicles, persons) for vehicles, persons in frames]
+        # the agents of the previous frame that are not in a frame have arrived, the first frame follows the last
+        for previous, frame in zip(self._frames[-1:] + self._frames[:-1], self._frames):
+            frame['arrived'] = {
+                tc.VAR_ARRIVED_VEHICLES_IDS: tuple(set(previous['vehicle_ids']) - set(frame['vehicle_ids'])),
+                tc.VAR_ARRIVED_PERSONS_IDS: tuple(set(previous['person_ids']) - set(frame['person_ids']))}
+        self._index = -1
+        self._time = 0
+        self._halting_total = {}
+        self.phase = None
+        self.junction = _Junction(self)
+        self.vehicle = _IDList(self, 'vehicles')
+        self.person = _IDList(self, 'persons')
+        self.edge = _Edge(self)
+        self.simulation = _Simulation(self)
+        self.trafficlight = _TrafficLight(self)
+        self.meandata = _MeanData(self)
+
+    @staticmethod
+    def _prepare(vehicles, persons):
+        vehicle_results = {veh_id: {tc.VAR_LANE_ID: lane_id, tc.VAR_LANEPOSITION: pos, tc.VAR_ROAD_ID: road,
+                                    tc.VAR_ACCUMULATED_WAITING_TIME: wait}
+                           for veh_id, (lane_id, pos, road, wait, _) in vehicles.items()}
+        person_results = {ped_id: {tc.VAR_LANE_ID: lane_id, tc.VAR_LANEPOSITION: pos, tc.VAR_WAITING_TIME: wait}
+                          for ped_id, (lane_id, pos, wait) in persons.items()}
+        halting = {}
+        for _, _, road, _, speed in vehicles.values():
+            if speed < 0.1:
+                halting[road] = halting.get(road, 0) + 1
+        return {'vehicles': vehicle_results, 'persons': person_results,
+                'agents': dict(vehicle_results, **person_results), 'halting': halting,
+                'vehicle_ids': tuple(vehicles), 'person_ids': tuple(persons)}
+
+    def _frame(self):
+        return self._frames[self._index % len(self._frames)]
+
+    def start(self, cmd, label='default', **kwargs):
+        self.load(cmd[1:])
+
+    def load(self, args):
+        self._index = -1
+        self._time = 0
+        self._halting_total = {}
+        self.junction._subscribed_at = {}
+        self.junction._subscriptions = set()
+
+    def close(self, wait=True):
+        pass
+
+    def simulationStep(self, step=0):
+        # a target time runs the steps up to it, like sumo
+        for _ in range(max(int(step) - self._time, 1)):
+            self._index += 1
+            self._time += 1
+            for road, count in self._frame()['halting'].items():
+                self._halting_total[road] = self._halting_total.get(road, 0) + count
+
+
+class _Junction:
+    def __init__(self, fake):
+        self._fake = fake
+        # domain -> step it was last subscribed at, and the domains that stay subscribed
+        self._subscribed_at = {}
+        self._subscriptions = set()
+
+    def subscribeContext(self, junction_id, domain, dist, varIDs=None, begin=None, end=None):
+        self._subscribed_at[domain] = self._fake._index
+        self._subscriptions.add(domain)
+
+    def unsubscribeContext(self, junction_id, domain, dist):
+        # the results of the step stay readable until the next step, as with traci
+        self._subscriptions.discard(domain)
+
+    def _active(self, domain):
+        return domain in self._subscriptions or self._subscribed_at.get(domain) == self._fake._index
+
+    def getContextSubscriptionResults(self, junction_id):
+        if self._fake._index < 0:
+            return {}
+        frame = self._fake._frame()
+        vehicles = self._active(tc.CMD_GET_VEHICLE_VARIABLE)
+        persons = self._active(tc.CMD_GET_PERSON_VARIABLE)
+        if vehicles and persons:
+            return frame['agents']
+        if vehicles:
+            return frame['vehicles']
+        return frame['persons'] if persons else {}
+
+
+class _IDList:
+    def __init__(self, fake, agents):
+        self._fake = fake
+        self._key = 'vehicle_ids' if agents == 'vehicles' else 'person_ids'
+
+    def getIDList(self):
+        return self._fake._frame()[self._key] if self._fake._index >= 0 else ()
+
+
+class _Edge:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def getLastStepHaltingNumber(self, edge_id):
+        return self._fake._frame()['halting'].get(edge_id, 0)
+
+
+class _Simulation:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def subscribe(self, varIDs, begin=None, end=None):
+        pass
+
+    def getSubscriptionResults(self):
+        return self._fake._frame()['arrived'] if self._fake._index >= 0 else {}
+
+    def getEmergencyStoppingVehiclesIDList(self):
+        return ()
+
+    def getMinExpectedNumber(self):
+        frame = self._fake._frame()
+        return len(frame['vehicle_ids']) + len(frame['person_ids'])
+
+    def getParameter(self, object_id, key):
+        return '0'
+
+    def getTime(self):
+        return float(self._fake._time)
+
+
+class _TrafficLight:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def setPhase(self, tls_id, index):
+        self._fake.phase = index
+
+
+class _MeanData:
+    def __init__(self, fake):
+        self._fake = fake
+
+    def getAttributeValues(self, mean_data_id, attr):
+        return tuple(float(self._fake._halting_total.get(edge, 0)) for edge in APPROACH_EDGES)
@@ -1,186 +1,179 @@
+import hashlib
 import numpy as np
 import math
+import re
+
+ROUTES_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<routes>
+    <vType id="slow" length="5" maxSpeed="8.33" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
+    <vType id="medium" length="5" maxSpeed="13.9" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
+    <vType id="fast" length="5" maxSpeed="22.2" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
+    <vType id="ped" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>
+
+    <route id="W_E" edges="WW2TL W2TL TL2E TL2EE"/>
+    <route id="E_W" edges="EE2TL E2TL TL2W TL2WW"/>
+    <route id="N_S" edges="NN2TL N2TL TL2S TL2SS"/>
+    <route id="S_N" edges="SS2TL S2TL TL2N TL2NN"/>
+
+    <route id="S_W" edges="SS2TL S2TL TL2W TL2WW"/>
+    <route id="W_N" edges="WW2TL W2TL TL2N TL2NN"/>
+    <route id="N_E" edges="NN2TL N2TL TL2E TL2EE"/>
+    <route id="E_S" edges="EE2TL E2TL TL2S TL2SS"/>
+
+    <route id="S_E" edges="SS2TL S2TL TL2E TL2EE"/>
+    <route id="W_S" edges="WW2TL W2TL TL2S TL2SS"/>
+    <route id="N_W" edges="NN2TL N2TL TL2W TL2WW"/>
+    <route id="E_N" edges="EE2TL E2TL TL2N TL2NN"/>
+
+    <flow id="WE" route="W_E" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" />
+    <flow id="EW" route="E_W" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" />
+    <flow id="NS" route="N_S" type="medium" begin="0" end="5400" probability="0.02" departLane="2" departSpeed="5" />
+    <flow id="SN" route="S_N" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" />
+
+    <flow id="SW" route="S_W" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
+    <flow id="WN" route="W_N" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
+    <flow id="NE" route="N_E" type="slow" begin="0" end="5400" probability="0.02" departLane="1" departSpeed="5" />
+    <flow id="ES" route="E_S" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
+
+    <flow id="SE" route="S_E" type="medium" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
+    <flow id="WS" route="W_S" type="medium" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
+    <flow id="NW" route="N_W" type="fast" begin="0" end="5400" probability="0.02" departLane="random" departSpeed="5" />
+    <flow id="EN" route="E_N" type="fast" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
+
+"""
+
+# n_cars_generated the probabilities of the flows in ROUTES_HEADER are set for, other numbers of cars scale them
+FLOW_CARS = 1000
+
+PERSON = """    <person id="p%i" type="ped" depart="%s" departPos="0">
+        <walk from="%s" to="%s" arrivalPos="-1"/>
+    </person>
+"""
+
+# (from, to) edges of the pedestrians, indexed by the 1-8 choice
+# crossing straight: S2TL TL2N, TL2S N2TL, E2TL W2TL, TL2W TL2E
+STRAIGHT_WALKS = [None, ('S2TL', 'TL2N'), ('TL2N', 'S2TL'), ('TL2S', 'N2TL'), ('N2TL', 'TL2S'),
+                  ('E2TL', 'W2TL'), ('W2TL', 'E2TL'), ('TL2W', 'TL2E'), ('TL2E', 'TL2W')]
+# x crosswalk: right 1-1, right 1-2, left 1-1, left 1-2
+DIAGONAL_WALKS = [None, ('N2TL', 'TL2W'), ('TL2W', 'N2TL'), ('E2TL', 'S2TL'), ('S2TL', 'E2TL'),
+                  ('TL2N', 'TL2E'), ('TL2E', 'TL2N'), ('TL2N', 'TL2S'), ('TL2S', 'W2TL')]
+
+
+def draw_pedestrian_choices(rng, n_peds):
+    """
+    Draws what rng.randint(0, 100) followed by rng.randint(1, 9) for every pedestrian would draw,
+    leaving the random state where those 2 * n_peds calls would leave it.
+    Both calls take one 32 bit word per try: randint(0, 100) masks it to 7 bits and tries again above 99,
+    randint(1, 9) masks it to 3 bits and never tries again
+    :return: diag_ped, choice arrays
+    """
+    rng_state = rng.get_state()
+    words = rng.randint(0, 2 ** 32, size=3 * n_peds + 64, dtype=np.uint32)
+    accepted = (words & 127) <= 99
+    # index of the first accepted word at or after every index, len(words) if there is none
+    next_accepted = np.where(accepted, np.arange(len(words)), len(words))
+    next_accepted = np.minimum.accumulate(next_accepted[::-1])[::-1].tolist()
+    diag_index = np.empty(n_peds, dtype=np.int64)
+    position = 0
+    for k in range(n_peds):
+        if position >= len(words) - 1 or next_accepted[position] >= len(words) - 1:
+            # too many rejected words, draw them one by one
+            rng.set_state(rng_state)
+            return draw_pedestrian_choices_serial(rng, n_peds)
+        position = next_accepted[position]
+        diag_index[k] = position
+        position += 2
+    # replay the consumed words so that the next draws are unchanged
+    rng.set_state(rng_state)
+    rng.randint(0, 2 ** 32, size=position, dtype=np.uint32)
+    return (words[diag_index] & 127).astype(np.int64), (words[diag_index + 1] & 7).astype(np.int64) + 1
+
+
+def draw_pedestrian_choices_serial(rng, n_peds):
+    diag_ped = np.empty(n_peds, dtype=np.int64)
+    choice = np.empty(n_peds, dtype=np.int64)
+    for k in range(n_peds):
+        diag_ped[k] = rng.randint(0, 100)
+        choice[k] = rng.randint(1, 9)
+    return diag_ped, choice
+
 
 class TrafficGenerator:
+    # bumped whenever the routes generated for a seed change, cached route files of other versions are not used
+    version = 3
+
     def __init__(self, max_steps, n_cars_generated, n_peds_generated):
         self._n_cars_generated = n_cars_generated  # how many cars per episode
         self._n_peds_generated = n_peds_generated
         self._max_steps = max_steps
 
-    def generate_routefile(self, seed):
+    def _digest(self):
         """
-        Generation of the route of every car for one episode
+        Short hash of every parameter the routes of a seed depend on, to name the files generated from them
         """
-        np.random.seed(seed)  # make tests reproducible
+        params = (self.version, self._max_steps, self._n_cars_generated, self._n_peds_generated, ROUTES_HEADER, PERSON)
+        return hashlib.sha1(repr(params).encode()).hexdigest()[:12]
 
-        # the generation of cars is distributed according to a weibull distribution
-        timings = np.random.weibull(2, self._n_cars_generated)
-        ped_timings = np.random.uniform(2, self._n_peds_generated, self._n_peds_generated)
-        timings = np.sort(timings)
-        ped_timings = np.sort(ped_timings)
+    def generate_routefile(self, seed, route_file=None):
+        """
+        Generation of the route of every car for one episode
+        """
+        # the global random state continues from the generation, as if it had been seeded with the episode
+        np.random.set_state(self._generate(seed, route_file))
 
-        # reshape the distribution to fit the interval 0:max_steps
-        car_gen_steps = []
-        min_old = math.floor(timings[1])
-        max_old = math.ceil(timings[-1])
-        min_new = 0
-        max_new = self._max_steps
-        for value in timings:
-            car_gen_steps = np.append(car_gen_steps, ((max_new - min_new) / (max_old - min_old)) * (value - max_old) + max_new)
+    def _generate(self, seed, route_file=None):
+        """
+        Generation of the routes without touching the global random state
+        :return: the random state after the generation
+        """
+        if route_file is None:
+            route_file = "intersection/episode_routes.rou.xml"
+        rng = np.random.RandomState(seed)  # make tests reproducible
+        self._write_routes(rng, route_file)
+        return rng.get_state()
 
-        car_gen_steps = np.rint(car_gen_steps)  # round every value to int -> effective steps when a car will be generated
+    def _write_routes(self, rng, route_file):
+        """
+        Generate the routes with the random state rng and write them to route_file
+        """
+        # the generation of cars is distributed according to a weibull distribution, cars come from the flows
+        # but the draw is kept so that the random state stays the same
+        rng.weibull(2, self._n_cars_generated)
+        ped_timings = rng.uniform(2, self._n_peds_generated, self._n_peds_generated)
+        ped_timings = np.sort(ped_timings)
 
-        # apply same method to pedestrian
-        ped_gen_steps = []
+        # reshape the distribution to fit the interval 0:max_steps - 1400
         min_old_ped = math.floor(ped_timings[1])
         max_old_ped = math.ceil(ped_timings[-1])
         min_new_ped = 0
-        max_new_ped = self._max_steps -1400
-
-        for val in ped_timings:
-            ped_gen_steps = np.append(ped_gen_steps,  ((max_new_ped - min_new_ped) / (max_old_ped - min_old_ped)) * (val - max_old_ped) + max_new_ped)
-
+        max_new_ped = self._max_steps - 1400
+        ped_gen_steps = ((max_new_ped - min_new_ped) / (max_old_ped - min_old_ped)) * (ped_timings - max_old_ped) + max_new_ped
         ped_gen_steps = np.rint(ped_gen_steps)
         ped_gen_steps[0] = 0
-        # produce the file for cars generation, one car per line
-        with open("intersection/episode_routes.rou.xml", "w") as routes:
-            print('<?xml version="1.0" encoding="UTF-8"?>', file=routes)
-            print("""<routes>
-            <vType id="slow" length="5" maxSpeed="8.33" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
-            <vType id="medium" length="5" maxSpeed="13.9" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
-            <vType id="fast" length="5" maxSpeed="22.2" accel="2.6" decel="4.5" speedDev="0.5" sigma="0.2" vClass="passenger"/>
-            <route id="W_E" edges="WW2TL W2TL TL2E TL2EE"/>
-            <route id="E_W" edges="EE2TL E2TL TL2W TL2WW"/>
-            <route id="N_S" edges="NN2TL N2TL TL2S TL2SS"/>
-            <route id="S_N" edges="SS2TL S2TL TL2N TL2NN"/>
-        
-            <route id="S_W" edges="SS2TL S2TL TL2W TL2WW"/>
-            <route id="W_N" edges="WW2TL W2TL TL2N TL2NN"/>
-            <route id="N_E" edges="NN2TL N2TL TL2E TL2EE"/>
-            <route id="E_S" edges="EE2TL E2TL TL2S TL2SS"/>
-        
-            <route id="S_E" edges="SS2TL S2TL TL2E TL2EE"/>
-            <route id="W_S" edges="WW2TL W2TL TL2S TL2SS"/>
-            <route id="N_W" edges="NN2TL N2TL TL2W TL2WW"/>
-            <route id="E_N" edges="EE2TL E2TL TL2N TL2NN"/>""", file=routes)
-
-            print("""
-            <flow id="WE" route="W_E" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" /> 
-            <flow id="EW" route="E_W" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" />
-            <flow id="NS" route="N_S" type="medium" begin="0" end="5400" probability="0.02" departLane="2" departSpeed="5" />
-            <flow id="SN" route="S_N" type="medium" begin="0" end="5400" probability="0.05" departLane="2" departSpeed="5" />
-
-            <flow id="SW" route="S_W" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
-            <flow id="WN" route="W_N" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
-            <flow id="NE" route="N_E" type="slow" begin="0" end="5400" probability="0.02" departLane="1" departSpeed="5" />
-            <flow id="ES" route="E_S" type="slow" begin="0" end="5400" probability="0.05" departLane="1" departSpeed="5" />
-
-            <flow id="SE" route="S_E" type="medium" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
-            <flow id="WS" route="W_S" type="medium" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
-            <flow id="NW" route="N_W" type="fast" begin="0" end="5400" probability="0.02" departLane="random" departSpeed="5" />
-            <flow id="EN" route="E_N" type="fast" begin="0" end="5400" probability="0.05" departLane="random" departSpeed="5" />
-            """, file=routes)
-
-            for ped_counter, p_step in enumerate(ped_gen_steps):
-                diag_ped = np.random.randint(0, 100)
-                if diag_ped <= 72:
-                    if p_step <= 0:
-                        p_step = 0.0
-                    ped_straight = np.random.randint(1, 9)
-                    # S2TL TL2N
-                    if ped_straight == 1:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="S2TL" to="TL2N" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_straight == 2:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2N" to="S2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    # TL2S N2TL
-                    elif ped_straight == 3:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2S" to="N2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_straight == 4:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="N2TL" to="TL2S" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    # E2TL W2TL
-                    elif ped_straight == 5:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="E2TL" to="W2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_straight == 6:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="W2TL" to="E2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    # TL2W TL2E
-                    elif ped_straight == 7:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2W" to="TL2E" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_straight == 8:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2E" to="TL2W" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                else:
-                    ped_diag = np.random.randint(1, 9)
-                    # x crosswalk
-                    # right 1-1
-                    if ped_diag == 1:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="N2TL" to="TL2W" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_diag == 2:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2W" to="N2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    # right 1-2
-                    elif ped_diag == 3:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="E2TL" to="S2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_diag == 4:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="S2TL" to="E2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-
-                    # left 1-1
-                    elif ped_diag == 5:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2N" to="TL2E" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_diag == 6:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2E" to="TL2N" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    # left 1-2
-                    elif ped_diag == 7:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2N" to="TL2S" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-                    elif ped_diag == 8:
-                        print('    <vType id="p%i" vClass="pedestrian" width="0.5" length="0.21" minGap="0.2" maxSpeed="1.5" guiShape="pedestrian"/>\n' % ped_counter, file=routes)
-                        print('    <person id="p%i" type="p%i" depart="%s" departPos="0">\n' % (ped_counter, ped_counter, p_step), file=routes)
-                        print('        <walk from="TL2S" to="W2TL" arrivalPos="-1"/>\n', file=routes)
-                        print('    </person>\n', file=routes)
-
-            print("</routes>", file=routes)
-
-gen = TrafficGenerator(max_steps=5400, n_cars_generated=1000, n_peds_generated=300)
-gen.generate_routefile(seed=100)
\ No newline at end of file
+
+        diag_ped, choice = draw_pedestrian_choices(rng, len(ped_gen_steps))
+        straight = diag_ped <= 72
+        # pedestrians crossing straight never depart before 0
+        ped_gen_steps = np.where(straight & (ped_gen_steps <= 0), 0.0, ped_gen_steps)
+
+        walks = [STRAIGHT_WALKS[c] if s else DIAGONAL_WALKS[c] for s, c in zip(straight.tolist(), choice.tolist())]
+        persons = [PERSON % (ped_counter, p_step, walk[0], walk[1])
+                   for ped_counter, (p_step, walk) in enumerate(zip(ped_gen_steps.tolist(), walks))]
+        with open(route_file, "w") as routes:
+            routes.write(self._routes_header() + ''.join(persons) + "</routes>\n")
+
+    def _routes_header(self):
+        """
+        ROUTES_HEADER with the probabilities of the flows scaled to n_cars_generated, as is for FLOW_CARS cars
+        """
+        scale = self._n_cars_generated / FLOW_CARS
+        if scale == 1:
+            return ROUTES_HEADER
+        # a flow can not insert more than one car per second
+        return re.sub(r'probability="([0-9.]+)"', lambda m: 'probability="%g"' % min(float(m.group(1)) * scale, 1.0),
+                      ROUTES_HEADER)
+
+
+if __name__ == '__main__':
+    gen = TrafficGenerator(max_steps=5400, n_cars_generated=1000, n_peds_generated=300)
+    gen.generate_routefile(seed=100)
@@ -0,0 +1,63 @@
+import copy
+import threading
+import time
+import timeit
+
+
+class AsyncLearner:
+    """
+    Runs the training epochs of an episode on a background thread while the episode is simulated.
+    The actor chooses the actions with a snapshot of the local network that is published every
+    publish_interval epochs
+    """
+    def __init__(self, simulation, publish_interval):
+        self._sim = simulation
+        self._publish_interval = publish_interval
+        self._thread = None
+        self._simulating = False
+        self._epochs_done = 0
+        self._busy_time = 0
+        simulation.qnet_actor = copy.deepcopy(simulation.qnet_local)
+
+    def _start(self):
+        """
+        Start the training epochs of the episode, to be called once sumo is running
+        """
+        self._simulating = True
+        self._epochs_done = 0
+        self._busy_time = 0
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def _join(self):
+        """
+        Wait for the remaining epochs once the episode is simulated
+        :return: learner time overlapped with the simulation, total learner time
+        """
+        overlap_time = self._busy_time
+        self._simulating = False
+        self._thread.join()
+        return overlap_time, self._busy_time
+
+    def _work(self):
+        while self._epochs_done < self._sim._training_epochs:
+            # until the memory holds a batch there is nothing to learn, the epochs are kept for later
+            if self._sim._Memory._get_counter() < self._sim._batch_size:
+                if not self._simulating:
+                    break
+                time.sleep(0.01)
+                continue
+            start_time = timeit.default_timer()
+            self._sim._learn()
+            self._busy_time += timeit.default_timer() - start_time
+            self._epochs_done += 1
+            if self._epochs_done % self._publish_interval == 0:
+                self._publish()
+        self._publish()
+
+    def _publish(self):
+        """
+        Copy the parameters of the local network to the actor
+        """
+        with self._sim._actor_lock:
+            self._sim.qnet_actor.load_state_dict(self._sim.qnet_local.state_dict())
@@ -1,17 +1,63 @@
+import os
+import threading
 import numpy as np
 
 class Memory:
-    def __init__(self, state_size, max_mem_size, num_act):
+    def __init__(self, state_size, max_mem_size, num_act, path=None, legacy_sampling=False):
         self.state_size = state_size
         self.mem_size = max_mem_size
         self.num_act = num_act
-        self.mem_cntr = 0
-        self.state_memory = np.zeros((self.mem_size, self.state_size), dtype=np.int32)
-        self.new_state_memory = np.zeros((self.mem_size, self.state_size), dtype=np.int32)
-        self.action_memory = np.zeros(self.mem_size, dtype=np.int32)
-        self.reward_memory = {'reward_veh': np.zeros(self.mem_size, dtype=np.float32),
-                              'reward_ped': np.zeros(self.mem_size, dtype=np.float32),
-                              'reward': np.zeros(self.mem_size, dtype=np.float32)}
+        # uniform batches drawn with np.random.choice as before, to reproduce the results of earlier runs
+        self.legacy_sampling = legacy_sampling
+        # held while storing, sampling and updating priorities, the learner thread of an AsyncLearner samples
+        # while the episode stores its transitions
+        self._lock = threading.Lock()
+        # with a path the arrays are memory-mapped files, reopened with their content if they already exist
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        self._counters = self._array('counters', (1,), np.int64)
+        self.state_memory = self._array('state', (self.mem_size, self.state_size), np.int32)
+        self.new_state_memory = self._array('new_state', (self.mem_size, self.state_size), np.int32)
+        self.action_memory = self._array('action', (self.mem_size,), np.int32)
+        self.reward_memory = {'reward_veh': self._array('reward_veh', (self.mem_size,), np.float32),
+                              'reward_ped': self._array('reward_ped', (self.mem_size,), np.float32),
+                              'reward': self._array('reward', (self.mem_size,), np.float32)}
+
+    @property
+    def mem_cntr(self):
+        return int(self._counters[0])
+
+    @mem_cntr.setter
+    def mem_cntr(self, value):
+        self._counters[0] = value
+
+    def _array(self, name, shape, dtype):
+        """
+        Zeroed array in memory, or memory-mapped from name.npy under the memory path
+        """
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        filename = os.path.join(self.path, name + '.npy')
+        if os.path.exists(filename):
+            array = np.lib.format.open_memmap(filename, mode='r+')
+            if array.shape != shape or array.dtype != dtype:
+                raise ValueError('The memory file {} does not match the configured memory'.format(filename))
+            return array
+        return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+
+    def _flush(self):
+        """
+        Write the changes of the memory-mapped arrays to disk, the counters last
+        """
+        if self.path is None:
+            return
+        arrays = [value for value in vars(self).values() if isinstance(value, np.memmap)]
+        arrays += list(self.reward_memory.values())
+        for array in arrays:
+            if array is not self._counters:
+                array.flush()
+        self._counters.flush()
 
     def _store_transition(self, old_state, current_state, old_action, reward,  reward_veh, reward_ped):
         index = self.mem_cntr % self.mem_size
@@ -41,6 +87,279 @@ class Memory:
         return sample_dict
 
 
+    def _sample(self, batch_size):
+        """
+        :return: indices of batch_size transitions drawn uniformly, no importance-sampling weights
+        """
+        max_mem = min(self.mem_cntr, self.mem_size)
+        if self.legacy_sampling:
+            # O(max_mem) permutation on every call
+            return np.random.choice(max_mem, batch_size, replace=False), None
+        batch = np.random.randint(max_mem, size=batch_size)
+        # a batch holding a repeated index is drawn again, as in _sample_epochs
+        ordered = np.sort(batch)
+        if (ordered[1:] == ordered[:-1]).any():
+            batch = np.random.choice(max_mem, batch_size, replace=False)
+        return batch, None
+
+    def _sample_epochs(self, epochs, batch_size):
+        """
+        The batches of all the epochs at once, no index is repeated inside a batch
+        :return: epochs x batch_size indices, no importance-sampling weights
+        """
+        max_mem = min(self.mem_cntr, self.mem_size)
+        batches = np.random.randint(max_mem, size=(epochs, batch_size))
+        # batches holding a repeated index are drawn again, rare as long as batch_size is small next to the memory
+        ordered = np.sort(batches, axis=1)
+        for epoch in np.flatnonzero((ordered[:, 1:] == ordered[:, :-1]).any(axis=1)):
+            batches[epoch] = np.random.choice(max_mem, batch_size, replace=False)
+        return batches, None
+
+    def _update_priorities(self, batch, td_errors):
+        pass
+
+    def _get_batch(self, batch):
+        """
+        :param batch: indices of the sampled transitions
+        :return: the sampled transitions, same layout as _get_sample
+        """
+        return {'state': self.state_memory[batch], 'new_state': self.new_state_memory[batch],
+                'action': self.action_memory[batch],
+                'reward': {key: value[batch] for key, value in self.reward_memory.items()}}
+
     def _get_counter(self):
 
         return self.mem_cntr
+
+    def _state_dict(self):
+        """
+        Copy of the arrays of the memory, counters included, to be written in a checkpoint
+        """
+        state = {name: np.array(value) for name, value in vars(self).items() if isinstance(value, np.ndarray)}
+        state['reward_memory'] = {key: np.array(value) for key, value in self.reward_memory.items()}
+        return state
+
+    def _load_state_dict(self, state):
+        """
+        Restore the arrays of _state_dict, written into the files of a memory-mapped memory
+        """
+        state = dict(state)
+        for key, value in state.pop('reward_memory').items():
+            self.reward_memory[key][...] = value
+        for name, value in state.items():
+            if isinstance(getattr(self, name), np.memmap):
+                getattr(self, name)[...] = value
+            else:
+                setattr(self, name, value)
+        self._flush()
+
+
+class CompactMemory(Memory):
+    """
+    Memory that keeps the binary states bit-packed (24 bytes for 186 cells). The new state of every transition
+    is kept once and the next transition of the same episode points to it as its old state
+    """
+    # how many transitions later a new state can still be reused as an old state
+    slack = 256
+
+    def __init__(self, state_size, max_mem_size, num_act, path=None, legacy_sampling=False):
+        self.state_size = state_size
+        self.mem_size = max_mem_size
+        self.num_act = num_act
+        self.legacy_sampling = legacy_sampling
+        self._lock = threading.Lock()
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        # mem_cntr, first_cntr
+        self._counters = self._array('counters', (2,), np.int64)
+        packed_size = (state_size + 7) // 8
+        # new state of the transition t in slot t % new_states_size, the slack keeps it alive as long as the
+        # transitions pointing to it
+        self.new_states_size = max_mem_size + self.slack
+        self.new_states = self._array('new_states', (self.new_states_size, packed_size), np.uint8)
+        # old states that are not the new state of a recent transition (first transition of an episode),
+        # grown on demand and wrapped once it can hold the whole memory. Files are sparse, so a memory-mapped
+        # one gets its full size from the start
+        first_size = max_mem_size if path is not None else min(1024, max_mem_size)
+        self.first_states = self._array('first_states', (first_size, packed_size), np.uint8)
+        # slot of the old state, in new_states if >= 0, in first_states at -(slot + 1) otherwise
+        self.old_state_slot = self._array('old_state_slot', (self.mem_size,), np.int32)
+        self.action_memory = self._array('action', (self.mem_size,), np.int32)
+        self.reward_memory = {'reward_veh': self._array('reward_veh', (self.mem_size,), np.float32),
+                              'reward_ped': self._array('reward_ped', (self.mem_size,), np.float32),
+                              'reward': self._array('reward', (self.mem_size,), np.float32)}
+        # id of the last new states -> (state, transition counter), they are the old state of the next transition
+        self._pending = {}
+
+    @property
+    def first_cntr(self):
+        return int(self._counters[1])
+
+    @first_cntr.setter
+    def first_cntr(self, value):
+        self._counters[1] = value
+
+    def _store_first_state(self, state):
+        if self.first_cntr == len(self.first_states) and len(self.first_states) < self.mem_size:
+            grown = np.zeros((min(2 * len(self.first_states), self.mem_size), self.first_states.shape[1]), dtype=np.uint8)
+            grown[:len(self.first_states)] = self.first_states
+            self.first_states = grown
+        slot = self.first_cntr % len(self.first_states)
+        self.first_states[slot] = np.packbits(state)
+        self.first_cntr += 1
+        return -(slot + 1)
+
+    def _store_transition(self, old_state, current_state, old_action, reward,  reward_veh, reward_ped):
+        index = self.mem_cntr % self.mem_size
+        pending = self._pending.pop(id(old_state), None)
+        if pending is not None and pending[0] is old_state and self.mem_cntr - pending[1] <= self.slack:
+            self.old_state_slot[index] = pending[1] % self.new_states_size
+        else:
+            self.old_state_slot[index] = self._store_first_state(old_state)
+        self.new_states[self.mem_cntr % self.new_states_size] = np.packbits(current_state)
+        # the state is kept with its counter so that its id can not be reused while pending
+        self._pending[id(current_state)] = (current_state, self.mem_cntr)
+        if len(self._pending) > self.slack:
+            del self._pending[next(iter(self._pending))]
+        self.action_memory[index] = old_action
+        self.reward_memory['reward'][index] = reward
+        self.reward_memory['reward_veh'][index] = reward_veh
+        self.reward_memory['reward_ped'][index] = reward_ped
+        self.mem_cntr += 1
+
+    def _load_state_dict(self, state):
+        super(CompactMemory, self)._load_state_dict(state)
+        # states of the episode before the checkpoint are never the old state of a later transition
+        self._pending = {}
+
+    def _get_sample(self):
+        """
+        Unpacks the whole memory, use _get_batch to unpack only the sampled transitions
+        """
+        return self._get_batch(np.arange(min(self.mem_cntr, self.mem_size)))
+
+    def _get_batch(self, batch):
+        batch = np.asarray(batch)
+        # transition counter of every sampled index, the last one stored in that index
+        cntr = batch + (self.mem_cntr - 1 - batch) // self.mem_size * self.mem_size
+        new_state = self.new_states[cntr % self.new_states_size]
+        old_slot = self.old_state_slot[batch]
+        state = np.where((old_slot >= 0)[:, np.newaxis], self.new_states[np.maximum(old_slot, 0)],
+                         self.first_states[np.maximum(-old_slot - 1, 0)])
+        return {'state': np.unpackbits(state, axis=1, count=self.state_size),
+                'new_state': np.unpackbits(new_state, axis=1, count=self.state_size),
+                'action': self.action_memory[batch],
+                'reward': {key: value[batch] for key, value in self.reward_memory.items()}}
+
+
+class SumTree:
+    """
+    Array-backed binary tree where every node holds the sum of its children and the leaves hold the priorities
+    """
+    def __init__(self, capacity):
+        self.capacity = 1
+        while self.capacity < capacity:
+            self.capacity *= 2
+        # root in 0, children of i in 2i+1 and 2i+2, leaves in capacity-1 ... 2*capacity-2
+        self.tree = np.zeros(2 * self.capacity - 1, dtype=np.float64)
+
+    def total(self):
+        return self.tree[0]
+
+    def _update(self, indices, priorities):
+        """
+        Set the priorities of the leaves and the sums on their paths to the root, O(log n) per leaf
+        """
+        nodes = np.asarray(indices) + self.capacity - 1
+        if len(nodes) == 0:
+            return
+        self.tree[nodes] = priorities
+        nodes = np.unique(nodes)
+        while nodes[0] > 0:
+            nodes = np.unique((nodes - 1) // 2)
+            self.tree[nodes] = self.tree[2 * nodes + 1] + self.tree[2 * nodes + 2]
+
+    def _find(self, values):
+        """
+        Indices of the leaves where the cumulative sum of the priorities reaches values, O(log n) per value
+        """
+        nodes = np.zeros(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        while nodes[0] < self.capacity - 1:
+            left = 2 * nodes + 1
+            go_right = values > self.tree[left]
+            values = np.where(go_right, values - self.tree[left], values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - (self.capacity - 1)
+
+
+class PrioritizedMemory(Memory):
+    """
+    Memory that samples the transitions proportionally to their last TD error (prioritized experience replay)
+    and returns the importance-sampling weights that correct the bias of the sampling
+    """
+    def __init__(self, state_size, max_mem_size, num_act, alpha, beta, beta_increment, eps=1e-5, path=None):
+        super(PrioritizedMemory, self).__init__(state_size, max_mem_size, num_act, path=path)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(max_mem_size)
+        # priorities are not persisted, the transitions of a reopened memory start again from the same priority
+        self.tree._update(np.arange(min(self.mem_cntr, self.mem_size)), self.max_priority)
+
+    def _store_transition(self, old_state, current_state, old_action, reward,  reward_veh, reward_ped):
+        index = self.mem_cntr % self.mem_size
+        super(PrioritizedMemory, self)._store_transition(old_state, current_state, old_action, reward, reward_veh, reward_ped)
+        # new transitions are sampled at least once before their TD error is known
+        self.tree._update([index], self.max_priority)
+
+    def _sample(self, batch_size):
+        """
+        :return: indices of batch_size transitions drawn proportionally to their priority, importance-sampling weights
+        """
+        max_mem = min(self.mem_cntr, self.mem_size)
+        total = self.tree.total()
+        # one value in each of batch_size equal segments of the total priority
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * total / batch_size
+        batch = np.minimum(self.tree._find(values), max_mem - 1)
+        probs = self.tree.tree[batch + self.tree.capacity - 1] / total
+        weights = (max_mem * probs) ** -self.beta
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return batch, (weights / weights.max()).astype(np.float32)
+
+    def _sample_epochs(self, epochs, batch_size):
+        """
+        The batches of all the epochs drawn from the priorities as they are now, the priorities updated by the
+        epochs only count from the next call on
+        """
+        max_mem = min(self.mem_cntr, self.mem_size)
+        total = self.tree.total()
+        values = (np.arange(batch_size) + np.random.random((epochs, batch_size))) * total / batch_size
+        batches = np.minimum(self.tree._find(values.ravel()), max_mem - 1).reshape(epochs, batch_size)
+        probs = self.tree.tree[batches + self.tree.capacity - 1] / total
+        # beta annealed as if the epochs had been sampled one after the other
+        beta = np.minimum(1.0, self.beta + self.beta_increment * np.arange(epochs))[:, np.newaxis]
+        weights = (max_mem * probs) ** -beta
+        self.beta = min(1.0, self.beta + self.beta_increment * epochs)
+        return batches, (weights / weights.max(axis=1, keepdims=True)).astype(np.float32)
+
+    def _state_dict(self):
+        state = super(PrioritizedMemory, self)._state_dict()
+        state['priorities'] = {'tree': self.tree.tree.copy(), 'max_priority': self.max_priority, 'beta': self.beta}
+        return state
+
+    def _load_state_dict(self, state):
+        state = dict(state)
+        priorities = state.pop('priorities')
+        super(PrioritizedMemory, self)._load_state_dict(state)
+        self.tree.tree[...] = priorities['tree']
+        self.max_priority = priorities['max_priority']
+        self.beta = priorities['beta']
+
+    def _update_priorities(self, batch, td_errors):
+        priorities = (np.abs(td_errors) + self.eps) ** self.alpha
+        self.max_priority = max(self.max_priority, priorities.max())
+        self.tree._update(batch, priorities)
@@ -0,0 +1,43 @@
+import warnings
+import torch as T
+
+
+class GreedyPolicy:
+    """
+    Greedy action of a DeepQNetwork for a single state, with as little work per decision as possible: the state
+    is copied into an input tensor allocated once and the forward pass runs in inference mode, without autograd.
+    With script the forward pass goes through a TorchScript trace of the network, which shares its parameters,
+    so that learning steps and published weights are followed without tracing again.
+    _act_batch does the same for the states of up to batch_size environments in one forward pass
+    """
+    def __init__(self, network, script=False, batch_size=1):
+        self.network = network
+        with T.inference_mode():
+            self._input = T.zeros((batch_size, network.input_dims), dtype=T.float32, device=network.device)
+            self._single = self._input[:1]
+        self._forward = network.forward
+        if script:
+            with T.no_grad(), warnings.catch_warnings():
+                # torch.jit is deprecated in recent torch releases, it still runs
+                warnings.simplefilter('ignore', FutureWarning)
+                self._forward = T.jit.trace(network, T.zeros((1, network.input_dims), device=network.device))
+
+    def _act(self, state):
+        """
+        :param state: numpy state of the intersection
+        :return: index of the action with the highest q value
+        """
+        with T.inference_mode():
+            self._single[0].copy_(T.from_numpy(state))
+            return int(self._forward(self._single).argmax())
+
+    def _act_batch(self, states):
+        """
+        :param states: list of at most batch_size numpy states
+        :return: numpy array of the index of the action with the highest q value for every state
+        """
+        with T.inference_mode():
+            batch = self._input[:len(states)]
+            for row, state in zip(batch, states):
+                row.copy_(T.from_numpy(state))
+            return self._forward(batch).argmax(dim=1).cpu().numpy()
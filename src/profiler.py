@@ -0,0 +1,96 @@
+import csv
+import json
+import os
+import threading
+import timeit
+
+CSV_FIELDS = ['episode', 'section', 'calls', 'total_s', 'mean_us', 'max_us']
+
+
+class Profiler:
+    """
+    Wall time and number of calls of the sections of the simulation loop, aggregated per episode into
+    profile.csv and profile.json under path. With trace every call is also written as a Chrome trace event
+    to trace_<episode>.json, to be opened in chrome://tracing or Perfetto.
+    Only the functions wrapped by _timed are measured: without a profiler nothing is wrapped and the loop
+    runs as it always did
+    """
+    def __init__(self, path, trace=False):
+        self._path = path
+        self._trace = trace
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        # section -> [calls, total time, max time] of the running episode
+        self._sections = {}
+        self._events = []
+        self._origin = timeit.default_timer()
+        self._json_file = os.path.join(path, 'profile.json')
+        self._csv_file = os.path.join(path, 'profile.csv')
+        # a resumed training keeps the episodes profiled before
+        self._episodes = []
+        if os.path.exists(self._json_file):
+            with open(self._json_file) as f:
+                self._episodes = json.load(f)
+
+    def _timed(self, section, func):
+        """
+        func, recording the time of every call under section
+        """
+        clock = timeit.default_timer
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._record(section, start, clock())
+        return timed
+
+    def _record(self, section, start, end):
+        # the learner and the environments of a VecSimulation record from their own threads
+        with self._lock:
+            stats = self._sections.get(section)
+            if stats is None:
+                stats = self._sections[section] = [0, 0.0, 0.0]
+            stats[0] += 1
+            stats[1] += end - start
+            if end - start > stats[2]:
+                stats[2] = end - start
+            if self._trace:
+                self._events.append({'name': section, 'ph': 'X', 'ts': (start - self._origin) * 1e6,
+                                     'dur': (end - start) * 1e6, 'pid': os.getpid(), 'tid': threading.get_ident()})
+
+    def _episode_end(self, episode):
+        """
+        Write the aggregates (and the trace) of the episode and start the next one
+        """
+        with self._lock:
+            sections, self._sections = self._sections, {}
+            events, self._events = self._events, []
+        rows = [{'episode': episode, 'section': section, 'calls': calls, 'total_s': total,
+                 'mean_us': total / calls * 1e6, 'max_us': longest * 1e6}
+                for section, (calls, total, longest) in sorted(sections.items(), key=lambda item: -item[1][1])]
+
+        new_file = not os.path.exists(self._csv_file)
+        with open(self._csv_file, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+        self._episodes.append({'episode': episode,
+                               'sections': {row['section']: {field: row[field] for field in CSV_FIELDS[2:]}
+                                            for row in rows}})
+        self._write_json(self._json_file, self._episodes)
+        if self._trace:
+            self._write_json(os.path.join(self._path, 'trace_{}.json'.format(episode)),
+                             {'traceEvents': events, 'displayTimeUnit': 'ms'})
+
+        print("Profile:", ", ".join("{} {:.2f} s".format(row['section'], row['total_s']) for row in rows[:5]))
+        return rows
+
+    @staticmethod
+    def _write_json(filename, content):
+        tmp_file = filename + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(content, f)
+        os.replace(tmp_file, filename)
@@ -0,0 +1,104 @@
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# routes_s<seed>_<digest of the generator parameters>.rou.xml
+ROUTE_FILE = 'routes_s{}_{}.rou.xml'
+ROUTE_FILE_PATTERN = re.compile(r'routes_s(\d+)_(.+)\.rou\.xml$')
+
+
+class RouteCache:
+    """
+    Route files kept per seed and parameters of the generator, generated by a pool of workers for the next
+    lookahead seeds so that starting an episode is a lookup. Past max_size files on disk, those of earlier runs
+    included, the least recently used ones are removed
+    """
+    def __init__(self, TrafficGen, path, lookahead, max_size, workers=1):
+        self._TrafficGen = TrafficGen
+        self._path = path
+        self._lookahead = lookahead
+        self._max_size = max_size
+        os.makedirs(path, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        # key -> future of (route file, random state after the generation), in least recently used order
+        self._entries = OrderedDict()
+        self._load_entries()
+
+    def _key(self, seed):
+        return (seed, self._TrafficGen._digest())
+
+    def _load_entries(self):
+        """
+        Take over the route files left by earlier runs, the least recently used first, and trim them to max_size
+        """
+        filenames = [name for name in os.listdir(self._path) if ROUTE_FILE_PATTERN.match(name)]
+        filenames.sort(key=lambda name: os.path.getmtime(os.path.join(self._path, name)))
+        for name in filenames:
+            if not os.path.exists(os.path.join(self._path, name + '.rng')):
+                # interrupted generation
+                os.remove(os.path.join(self._path, name))
+                continue
+            seed, digest = ROUTE_FILE_PATTERN.match(name).groups()
+            key = (int(seed), digest)
+            self._entries[key] = self._pool.submit(self._generate, key)
+        self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self._max_size:
+            _, evicted = self._entries.popitem(last=False)
+            evicted.add_done_callback(self._remove)
+
+    def _get(self, seed):
+        """
+        Route file of seed, waiting for it if it is still being generated
+        :return: path of the route file, random state that generate_routefile(seed) leaves
+        """
+        future = self._submit(seed)
+        for next_seed in range(seed + 1, seed + 1 + self._lookahead):
+            self._submit(next_seed)
+        route_file, rng_state = future.result()
+        # the modification time orders the files by their last use for the next runs
+        os.utime(route_file)
+        return route_file, rng_state
+
+    def _submit(self, seed):
+        key = self._key(seed)
+        with self._lock:
+            future = self._entries.get(key)
+            if future is None:
+                future = self._pool.submit(self._generate, key)
+                self._entries[key] = future
+            self._entries.move_to_end(key)
+            self._evict()
+        return future
+
+    def _generate(self, key):
+        """
+        Route file and random state of key, reused from disk if an earlier run already generated them
+        """
+        route_file = os.path.join(self._path, ROUTE_FILE.format(*key))
+        state_file = route_file + '.rng'
+        if os.path.exists(route_file) and os.path.exists(state_file):
+            with open(state_file, 'rb') as f:
+                return route_file, pickle.load(f)
+        rng_state = self._TrafficGen._generate(key[0], route_file)
+        # the random state is written last, a route file without it is generated again
+        with open(state_file, 'wb') as f:
+            pickle.dump(rng_state, f)
+        return route_file, rng_state
+
+    @staticmethod
+    def _remove(future):
+        # a running sumo keeps reading its route file through the open file, removing it is safe
+        route_file, _ = future.result()
+        for filename in [route_file + '.rng', route_file]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def _close(self):
+        self._pool.shutdown(wait=True)
@@ -1,9 +1,21 @@
+import copy
 import traci
 import torch as T
 import numpy as np
 import random
 import timeit
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from subscription import TraciCounter, AgentCache
+from state_encoder import StateEncoder
+from learner import AsyncLearner
+from steady_state import SteadyStateDetector
+from wait_tracker import WaitTracker
+from policy import GreedyPolicy
+from detectors import DETECTORS_FILE, APPROACH_DATA, APPROACH_EDGES, QUEUE_WEIGHTS, EMERGENCY_STOPS, write_detectors
+from sumo_outputs import output_files, output_options, parse_outputs
 
 # phase codes based on environment.net.xml
 PHASE_EW_GREEN = 0  # action 0 code 00
@@ -26,11 +38,67 @@ print('cuda on {}'.format(T.cuda.is_available()))
 class Simulation:
     def __init__(self, Model, Memory, TrafficGen, sumo_cmd, gamma, max_steps, green_duration, ped_green_duration,
                  yellow_duration, ped_yellow_duration, num_states, num_states_veh, num_actions, training_epochs, batch_size,
-                 epsilon, epsilon_end, epsilon_dec, tau, max_mem_size):
+                 epsilon, epsilon_end, epsilon_dec, tau, max_mem_size, backend=traci, label='default', route_file=None,
+                 async_learning=False, publish_interval=50, fused_learning=False, double_dqn=True,
+                 target_update_interval=0, route_cache=None, episodes_per_sumo=1, pipeline=False, snapshots=None,
+                 early_termination=False, steady_window=20, steady_tolerance=0.05, phase_jump=False,
+                 output_path=None, profiler=None, script_policy=False, target_model=None, total_episodes=None):
         self.qnet_local = Model
-        self.qnet_target = Model
+        # separate copy that is only moved towards qnet_local by the target updates, the environments of a
+        # VecSimulation share the one of the learner instead of copying the network and its optimizer
+        if target_model is None:
+            target_model = copy.deepcopy(Model)
+            target_model.requires_grad_(False)
+        self.qnet_target = target_model
+        self._double_dqn = double_dqn
+        # 0: soft update with tau after every learning step, n: hard copy every n learning steps
+        self._target_update_interval = target_update_interval
+        self._learn_steps = 0
+        # network used to choose the actions, a published snapshot of qnet_local when learning asynchronously
+        self.qnet_actor = Model
+        self._actor_lock = threading.Lock()
+        # greedy actions of qnet_actor, through a TorchScript trace of it with script_policy
+        self._script_policy = script_policy
+        self._policy = None
+        # states the policy chooses for at once, one per environment of a VecSimulation
+        self._policy_batch_size = 1
         self._TrafficGen = TrafficGen
         self._sumo_cmd = sumo_cmd
+        # with phase_jump sumo advances a whole phase per call and the stats come from its detectors
+        self._phase_jump = phase_jump
+        if phase_jump:
+            write_detectors(DETECTORS_FILE)
+            self._sumo_cmd = sumo_cmd + ['-a', DETECTORS_FILE]
+        if snapshots is not None and getattr(backend, '__name__', None) == 'libsumo':
+            print('the warm-started episodes of', backend.__name__, 'drift from those of traci, falling back to traci')
+            backend = traci
+        self._backend = backend
+        self._label = label
+        # with output_path sumo writes its tripinfo, summary and edgeData outputs, parsed into KPIs after every episode
+        self._output_files = None
+        if output_path is not None:
+            os.makedirs(output_path, exist_ok=True)
+            self._output_files = output_files(output_path, label)
+        self._kpi_store = []
+        self._route_file = route_file
+        self._route_cache = route_cache
+        # one sumo process runs episodes_per_sumo episodes, switching to the next routes with load
+        self._episodes_per_sumo = episodes_per_sumo
+        self._sumo_episodes = 0
+        self._conn = None
+        self._startup_time_store = []
+        # with the pipeline the next episode is prepared by a background thread while the current one trains
+        self._preparer = ThreadPoolExecutor(max_workers=1) if pipeline else None
+        self._next = None
+        # episodes of the training, none is prepared past the last one
+        self._total_episodes = total_episodes
+        self._prep_time = 0
+        self._timings_store = []
+        # with snapshots the episodes start from the state saved after the warm-up, at step warm_up
+        self._snapshots = snapshots
+        self._start_step = 0
+        # with early termination the episode ends before max_steps once nothing more can happen
+        self._steady_state = SteadyStateDetector(steady_window, steady_tolerance) if early_termination else None
         self.gamma = gamma
         self._max_steps = max_steps
         self._green_duration = green_duration
@@ -55,6 +123,19 @@ class Simulation:
         self._cumulative_wait_store = []
         self._avg_queue_length_store = []
         self._avg_ped_queue_length_store = []
+        self._traci_calls_store = []
+        self._steps_store = []
+
+        self._traci = TraciCounter(traci)
+        self._agents = AgentCache()
+        self._encoder = StateEncoder(num_states_veh=num_states_veh, num_states_ped=num_states - num_states_veh)
+        self._learner = AsyncLearner(self, publish_interval) if async_learning else None
+        self._fused_learning = fused_learning
+        self._pinned = {}
+        self._learner_steps_store = []
+        self._profiler = profiler
+        if profiler is not None:
+            self._instrument(profiler)
 
 
     def run(self, episode, epsilon):
@@ -64,15 +145,106 @@ class Simulation:
         start_time = timeit.default_timer()
 
         # first, generate the route file for this simulation and set up sumo
-        self._TrafficGen.generate_routefile(seed=episode)
-        traci.start(self._sumo_cmd)
+        wait_time = self._start(episode)
+        prep_time = self._prep_time
+        if self._learner is not None:
+            self._learner._start()
         print("Simulating...")
+        simulate_start_time = timeit.default_timer()
+
+        while self._step < self._max_steps:
+            # get current state of the intersection and the reward of the previous action
+            current_state, reward, reward_veh, reward_ped = self._observe()
+            # saving the data into the memory
+            self._remember(current_state, reward, reward_veh, reward_ped)
+            if self._terminated():
+                break
+            # choose the light phase to activate, based on the current state of the intersection
+            action = self._choose_action(current_state, epsilon)
+            self._act(action)
+
+        self._finish(epsilon)
+        simulate_time = timeit.default_timer() - simulate_start_time
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+        if self._preparer is not None and self._has_episode(episode + 1):
+            self._next = (episode + 1, self._preparer.submit(self._prepare, episode + 1))
+        training_time = self._train()
+        self._save_timings(prep_time, wait_time, simulate_time, training_time)
+        if self._profiler is not None:
+            self._profiler._episode_end(episode)
+
+        return simulation_time, training_time
+
+    def _instrument(self, profiler):
+        """
+        Time the sections of the loop by wrapping the methods of this simulation and of the memory,
+        the TraCI calls are timed per command by TraciCounter
+        """
+        sections = [('_get_state', 'encode_veh'), ('_get_ped_state', 'encode_ped'),
+                    ('_collect_waiting_times', 'reward_veh'), ('_collect_ped_waiting_times', 'reward_ped'),
+                    ('_choose_action', 'choose_action'), ('_choose_actions', 'choose_actions'),
+                    ('_set_yellow_phase', 'yellow_phase'), ('_set_green_phase', 'green_phase'),
+                    ('_learn', 'learn'), ('_learn_batch', 'learn_batch')]
+        for method, section in sections:
+            setattr(self, method, profiler._timed(section, getattr(self, method)))
+        # the environments of a VecSimulation share the memory, it is wrapped once
+        if '_store_transition' not in vars(self._Memory):
+            self._Memory._store_transition = profiler._timed('store_transition', self._Memory._store_transition)
+
+    def _save_timings(self, prep_time, wait_time, simulate_time, learn_time):
+        """
+        Keep the time spent preparing, simulating and learning the episode, overlap is the preparation time
+        that ran while the previous episode was learning
+        """
+        overlap_time = max(0.0, prep_time - wait_time)
+        self._timings_store.append({'prep': prep_time, 'simulate': simulate_time, 'learn': learn_time,
+                                    'overlap': overlap_time})
+        print("Prep:", round(prep_time, 2), "s - Simulate:", round(simulate_time, 1), "s - Learn:",
+              round(learn_time, 1), "s - Overlap:", round(overlap_time, 2), "s")
+
+    def _train(self):
+        """
+        Run the training epochs of the episode, or wait for the background learner to complete them
+        """
+        print("Training...")
+        start_time = timeit.default_timer()
+        if self._learner is not None:
+            overlap_time, learner_time = self._learner._join()
+            print("Learner time:", round(learner_time, 1), "s - overlapped with simulation:", round(overlap_time, 1), "s")
+        elif self._fused_learning:
+            self._learn_epochs(self._training_epochs)
+        else:
+            for _ in range(self._training_epochs):
+                self._learn()
+        training_time = timeit.default_timer() - start_time
+        if self._learner is None and self._Memory._get_counter() >= self._batch_size:
+            self._learner_steps_store.append(self._training_epochs / training_time)
+            print("Learner steps/s:", round(self._learner_steps_store[-1], 1))
+        return round(training_time, 1)
+
+    def _start(self, episode):
+        """
+        Prepare the episode, or take it from the pipeline, and reset the episode counters
+        :return: time spent waiting for the episode to be ready
+        """
+        start_time = timeit.default_timer()
+        if self._next is not None and self._next[0] == episode:
+            rng_state = self._wait_prepared()
+        else:
+            # a sumo prepared for another episode is loaded again or restarted by _prepare
+            self._wait_prepared()
+            rng_state = self._prepare(episode)
+        # the episode continues from the random state of its route generation, as it always did
+        np.random.set_state(rng_state)
+        wait_time = timeit.default_timer() - start_time
+        self._traci = TraciCounter(self._conn, self._profiler)
+        self._agents._subscribe(self._traci, loaded_state=self._start_step > 0)
 
         # inits
-        self._step = 0
+        self._step = self._start_step
         self.stop = 0
-        self._waiting_times = {}
-        self._waiting_times_ped = {}
+        self._waiting_times = WaitTracker()
+        self._waiting_times_ped = WaitTracker()
         self._sum_neg_reward = 0
         self._sum_neg_veh_reward = 0
         self._sum_neg_ped_reward = 0
@@ -81,217 +253,211 @@ class Simulation:
         self._sum_ped_queue_length = 0
 
         self._sum_waiting_time = 0
-        old_total_wait = 0
-        old_total_wait_ped = 0
-        old_state = -1
-        old_action = -1
+        self._queue_length = 0
+        if self._phase_jump:
+            # counters of sumo, the stats of a phase are their difference over the phase
+            self._halting_total = self._get_halting_total()
+            self._emergency_stops = self._get_emergency_stops()
+        if self._steady_state is not None:
+            self._steady_state._reset()
+        self._old_total_wait = 0
+        self._old_total_wait_ped = 0
+        self._old_state = -1
+        self._old_action = -1
+        return wait_time
+
+    def _has_episode(self, episode):
+        return self._total_episodes is None or episode < self._total_episodes
+
+    def _prepare(self, episode):
+        """
+        Generate the route file of the episode (or look it up in the route cache) and bring sumo up with it.
+        The global random state is not touched, so that it can run while the previous episode is learning
+        :return: the random state after the route generation
+        """
+        start_time = timeit.default_timer()
+        if self._route_cache is not None:
+            route_file, rng_state = self._route_cache._get(episode)
+        else:
+            rng_state = self._TrafficGen._generate(episode, route_file=self._route_file)
+            route_file = self._route_file
+        sumo_cmd = self._sumo_cmd if route_file is None else self._sumo_cmd + ['-r', route_file]
+        if self._output_files is not None:
+            sumo_cmd = sumo_cmd + output_options(self._output_files)
+        sumo_start_time = timeit.default_timer()
+        if self._snapshots is not None:
+            sumo_cmd = sumo_cmd + self._snapshots.save_options
+            snapshot_file = self._snapshots._snapshot_file(episode)
+            if not os.path.exists(snapshot_file):
+                # the first episode of a seed runs the warm-up once, then starts from the saved state like the others
+                self._start_sumo(sumo_cmd)
+                self._snapshots._save(self._conn, snapshot_file)
+            sumo_cmd = sumo_cmd + ['--load-state', snapshot_file]
+            self._start_step = self._snapshots.warm_up
+        self._start_sumo(sumo_cmd)
+        self._startup_time_store.append(timeit.default_timer() - sumo_start_time)
+        self._prep_time = timeit.default_timer() - start_time
+        return rng_state
+
+    def _wait_prepared(self):
+        """
+        Wait for the episode prepared in the background, if any
+        :return: its random state, None without a prepared episode
+        """
+        if self._next is None:
+            return None
+        _, future = self._next
+        self._next = None
+        return future.result()
 
+    def _start_sumo(self, sumo_cmd):
+        """
+        Load the episode into the running sumo, or start a new one after episodes_per_sumo episodes or an error
+        """
+        if self._conn is not None and self._sumo_episodes < self._episodes_per_sumo:
+            try:
+                # same options as the command line, without the binary
+                self._conn.load(sumo_cmd[1:])
+                return
+            except Exception as error:
+                # traci and libsumo raise their own exception types
+                print('Reloading sumo failed, restarting it:', error)
+        self._close_conn()
+        self._backend.start(sumo_cmd, label=self._label)
+        # libsumo runs a single sumo inside this process and has no connection objects
+        self._conn = traci.getConnection(self._label) if self._backend is traci else self._backend
+        self._sumo_episodes = 0
+
+    def _close_sumo(self):
+        """
+        Close the running sumo, if any, once the episode prepared in the background is up
+        """
+        self._wait_prepared()
+        self._close_conn()
 
-        while self._step < self._max_steps:
-            # get current state of the intersection
-            current_state_veh = self._get_state()
-            current_state_ped = self._get_ped_state()
-            current_state = current_state_veh + current_state_ped
-            # calculate reward of previous action: (change in cumulative waiting time between actions)
-            # waiting time = seconds waited by a car since the spawn in the environment, cumulated for every car in incoming lanes
-            current_total_wait = self._collect_waiting_times()
-            # In a certain interval, it is wise to make a current total waiting time
-            current_total_wait_ped = self._collect_ped_waiting_times()
-            reward_veh = old_total_wait - current_total_wait
-            reward_ped = (old_total_wait_ped - current_total_wait_ped) / 50
-            reward = reward_veh + reward_ped - self.stop*100
-            # saving the data into the memory
-            if self._step != 0:
-                self._Memory._store_transition(old_state, current_state, old_action, reward, reward_veh, reward_ped)
-            # choose the light phase to activate, based on the current state of the intersection
-            action = self._choose_action(current_state, epsilon)
+    def _close_conn(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.close()
+        except Exception:
+            # the connection of a sumo that crashed is closed already
+            pass
+        self._conn = None
+
+    def _observe(self):
+        """
+        Get the current state of the intersection and the reward of the previous action
+        """
+        current_state_veh = self._get_state()
+        current_state_ped = self._get_ped_state()
+        current_state = np.concatenate((current_state_veh, current_state_ped))
+        # calculate reward of previous action: (change in cumulative waiting time between actions)
+        # waiting time = seconds waited by a car since the spawn in the environment, cumulated for every car in incoming lanes
+        current_total_wait = self._collect_waiting_times()
+        # In a certain interval, it is wise to make a current total waiting time
+        current_total_wait_ped = self._collect_ped_waiting_times()
+        if self._step == self._start_step:
+            # the waits of the warm-up are not the consequence of any action
+            self._old_total_wait = current_total_wait
+            self._old_total_wait_ped = current_total_wait_ped
+        reward_veh = self._old_total_wait - current_total_wait
+        reward_ped = (self._old_total_wait_ped - current_total_wait_ped) / 50
+        reward = reward_veh + reward_ped - self.stop*100
+        self._old_total_wait = current_total_wait
+        self._old_total_wait_ped = current_total_wait_ped
+
+        # saving only the meaningful reward to better see if the agent is behaving correctly
+        if reward < 0:
+            self._sum_neg_reward += reward
+        if reward_veh < 0:
+            self._sum_neg_veh_reward += reward_veh
+        if reward_ped < 0:
+            self._sum_neg_ped_reward += reward_ped
+        return current_state, reward, reward_veh, reward_ped
+
+    def _terminated(self):
+        """
+        With early termination, whether nothing more can happen after the last observation: no vehicle or person
+        is left in the network or still to depart, or the queues and the waits have been steady for a while
+        """
+        if self._steady_state is None:
+            return False
+        if self._traci.simulation.getMinExpectedNumber() == 0:
+            print("Nothing left to simulate, episode ended at step", self._step)
+            return True
+        if self._steady_state._update(self._step, self._queue_length, self._old_total_wait + self._old_total_wait_ped):
+            print("Steady state, episode ended at step", self._step)
+            return True
+        return False
+
+    def _remember(self, current_state, reward, reward_veh, reward_ped):
+        """
+        Store the transition that led to the current state
+        """
+        if self._step != self._start_step:
+            with self._Memory._lock:
+                self._Memory._store_transition(self._old_state, current_state, self._old_action, reward, reward_veh,
+                                               reward_ped)
+        self._old_state = current_state
 
-            # if the chosen phase is different from the last phase, activate the yellow phase
-            if self._step != 0 and old_action != action:
-                if old_action == 0 or old_action == 1:
-                    self._set_yellow_phase(old_action + 1, act_bool=True)
-                    self._simulate(self._ped_yellow_duration)
-                    self._set_yellow_phase(old_action + 2, act_bool=True)
-                    self._simulate(self._yellow_duration)
-                elif old_action == 5:
-                    self._set_yellow_phase(old_action)
-                    self._simulate(self._ped_yellow_duration)
-                else:
-                    self._set_yellow_phase(old_action)
-                    self._simulate(self._yellow_duration)
-
-            # execute the phase selected before
-            self._set_green_phase(action)
-            if action == 5:
-                self._simulate(self._ped_green_duration)
+    def _act(self, action):
+        """
+        Switch the traffic light to the chosen phase, through the yellow phases if the phase changes
+        """
+        old_action = self._old_action
+        # if the chosen phase is different from the last phase, activate the yellow phase
+        if self._step != self._start_step and old_action != action:
+            if old_action == 0 or old_action == 1:
+                self._set_yellow_phase(old_action + 1, act_bool=True)
+                self._simulate(self._ped_yellow_duration)
+                self._set_yellow_phase(old_action + 2, act_bool=True)
+                self._simulate(self._yellow_duration)
+            elif old_action == 5:
+                self._set_yellow_phase(old_action)
+                self._simulate(self._ped_yellow_duration)
             else:
-                self._simulate(self._green_duration)
-
-            # saving variables for later & accumulate reward
-            old_state = current_state
-            old_action = action
-            old_total_wait = current_total_wait
-            old_total_wait_ped = current_total_wait_ped
-
-            # saving only the meaningful reward to better see if the agent is behaving correctly
-            if reward < 0:
-                self._sum_neg_reward += reward
-            if reward_veh < 0:
-                self._sum_neg_veh_reward += reward_veh
-            if reward_ped < 0:
-                self._sum_neg_ped_reward += reward_ped
+                self._set_yellow_phase(old_action)
+                self._simulate(self._yellow_duration)
+
+        # execute the phase selected before
+        self._set_green_phase(action)
+        if action == 5:
+            self._simulate(self._ped_green_duration)
+        else:
+            self._simulate(self._green_duration)
+        self._old_action = action
+
+    def _finish(self, epsilon):
+        """
+        Save the stats of the episode, flush the memory and close sumo unless it runs the next episode too
+        """
         self._save_episode_stats()
+        self._Memory._flush()
         # print("Total reward:", self._sum_neg_reward, "- Epsilon:", round(self._epsilon, 2))
         print("Total reward:", self._sum_neg_reward,
               "Total veh reward:", self._sum_neg_veh_reward,
               "Total ped reward:", self._sum_neg_ped_reward,
               "- Epsilon:", round(epsilon, 2))
-        traci.close()
-        simulation_time = round(timeit.default_timer() - start_time, 1)
-
-        print("Training...")
-        start_time = timeit.default_timer()
-        for _ in range(self._training_epochs):
-            self._learn()
-        training_time = round(timeit.default_timer() - start_time, 1)
-
-        return simulation_time, training_time
+        print("TraCI calls:", self._traci.calls)
+        self._sumo_episodes += 1
+        # the outputs are only complete once sumo is closed
+        if self._sumo_episodes >= self._episodes_per_sumo or self._output_files is not None:
+            self._close_conn()
+        if self._output_files is not None:
+            self._kpi_store.append(parse_outputs(self._output_files, APPROACH_EDGES))
 
     def _get_state(self):
-        num_states = self._num_state_veh
-        state = np.zeros(num_states)
-        car_list = traci.vehicle.getIDList()
-        for car_id in car_list:
-            lane_pos = traci.vehicle.getLanePosition(car_id)
-            lane_id = traci.vehicle.getLaneID(car_id)
-            lane_pos = 100 - lane_pos
-            # distance in meters from the traffic light -> mapping into cells
-            if lane_pos < 5:
-                lane_cell = 0
-            elif lane_pos < 10:
-                lane_cell = 1
-            elif lane_pos < 15:
-                lane_cell = 2
-            elif lane_pos < 20:
-                lane_cell = 3
-            elif lane_pos < 25:
-                lane_cell = 4
-            # interval 10m
-            elif lane_pos < 35:
-                lane_cell = 5
-            elif lane_pos < 45:
-                lane_cell = 6
-            # interval 20m
-            elif lane_pos < 65:
-                lane_cell = 7
-            elif lane_pos < 85:
-                lane_cell = 8
-            elif lane_pos < 100:
-                lane_cell = 9
-            else:
-                lane_cell = -1
-
-            # finding the lane where the car is located
-            # x2TL_3 are the "turn left only" lanes
-            if lane_id == "W2TL_1" or lane_id == "W2TL_2" or lane_id == "WW2TL_1" or lane_id == "WW2TL_2":
-                # 西の上のレーングループ
-                lane_group = 0
-            elif lane_id == "W2TL_3" or lane_id == "WW2TL_3":
-                lane_group = 1
-            elif lane_id == "N2TL_1" or lane_id == "N2TL_2" or lane_id == "NN2TL_1" or lane_id == "NN2TL_2":
-                lane_group = 2
-            elif lane_id == "N2TL_3" or lane_id == "NN2TL_3":
-                lane_group = 3
-            elif lane_id == "E2TL_1" or lane_id == "E2TL_2" or lane_id == "EE2TL_1" or lane_id == "EE2TL_2":
-                lane_group = 4
-            elif lane_id == "E2TL_3" or lane_id == "EE2TL_3":
-                lane_group = 5
-            elif lane_id == "S2TL_1" or lane_id == "S2TL_2" or lane_id == "SS2TL_1" or lane_id == "SS2TL_2":
-                lane_group = 6
-            elif lane_id == "S2TL_3" or lane_id == "SS2TL_3":
-                lane_group = 7
-            else:
-                lane_group = -1
-
-            if lane_group >= 1 and lane_group <= 7:
-                car_position = int(str(lane_group) + str(lane_cell))  # composition of the two postion ID to create a number in interval 0-79
-                valid_car = True
-            elif lane_group == 0:
-                car_position = lane_cell
-                valid_car = True
-            else:
-                valid_car = False  # flag for not detecting cars crossing the intersection or driving away from it
-
-            if valid_car:
-                state[car_position] = 1  # write the position of the car car_id in the state array in the form of "cell occupied"
-        state = list(map(int, state))
-        return state
+        """
+        Retrieve the cell occupancy of the incoming lanes, |state| = 80
+        """
+        return self._encoder.encode_veh(list(self._agents.vehicles().values()))
 
     def _get_ped_state(self):
-        ped_list = traci.person.getIDList()
-        # |w_state| = 40
-        w_state = np.zeros((4, 10))
-        # |c_state| = 36
-        c_state = np.zeros((4, 9))
-        # |xc_state| = 30
-        xc_state = np.zeros((2, 15))
-        # |state| = 40+36+30 = 106
-        for ped_id in ped_list:
-            lane_pos = traci.person.getLanePosition(ped_id)
-            lane_id = traci.person.getLaneID(ped_id)
-            lane_cell = int(lane_pos // 2)
-            lane_cell_wait = int(lane_pos // 1)
-            if lane_cell_wait >= 10:
-                lane_cell_wait = 9
-            if 'TL_w' in lane_id:
-                if 'TL_w0_0' in lane_id:
-                    lane_group = 0
-                elif 'TL_w1_0' in lane_id:
-                    lane_group = 1
-                elif 'TL_w2_0' in lane_id:
-                    lane_group = 2
-                elif 'TL_w3_0' in lane_id:
-                    lane_group = 3
-                else:
-                    lane_group = -1
-                for lg in range(4):
-                    if lane_group == lg:
-                        if 0 <= lane_cell_wait <= 10:
-                            w_state[lg][lane_cell_wait] = 1
-            if lane_id in ['TL_c1_0', 'TL_c3_0', 'TL_c4_0', 'TL_c5_0']:
-                if 'TL_c1_0' in lane_id:
-                    lane_group_c = 0
-                elif 'TL_c3_0' in lane_id:
-                    lane_group_c = 1
-                elif 'TL_c4_0' in lane_id:
-                    lane_group_c = 2
-                elif 'TL_c5_0' in lane_id:
-                    lane_group_c = 3
-                else:
-                    lane_group_c = -1
-                for clg in range(4):
-                    if lane_group_c == clg:
-                        if 0 <= lane_cell <= 9:
-                            c_state[clg][lane_cell] = 1
-
-            # for scramble crossing
-            if lane_id in ['TL_c0_0', 'TL_c2_0']:
-                if 'TL_c0_0' in lane_id:
-                    lane_group_xc = 0
-                elif 'TL_c2_0' in lane_id:
-                    lane_group_xc = 1
-                else:
-                    lane_group_xc = -1
-                for clg in range(2):
-                    if lane_group_xc == clg:
-                        if 0 <= lane_cell <= 15:
-                            xc_state[clg][lane_cell] = 1
-
-        w_state = list(map(int, w_state.flatten()))
-        c_state = list(map(int, c_state.flatten()))
-        xc_state = list(map(int, xc_state.flatten()))
-        ped_state = w_state + c_state + xc_state
-        return ped_state
+        """
+        Retrieve the cell occupancy of the waiting areas and crossings, |state| = 40+36+30 = 106
+        """
+        return self._encoder.encode_ped(list(self._agents.persons().values()))
 
     def _simulate(self, steps_todo):
         """
@@ -300,59 +466,104 @@ class Simulation:
         #print('green duration:{}'.format(steps_todo))
         if (self._step + steps_todo) >= self._max_steps:  # do not do more steps than the maximum allowed number of steps
             steps_todo = self._max_steps - self._step
+        if self._phase_jump and steps_todo > 0:
+            self._jump(steps_todo)
+            return
         # どこかの道の青信号が終わるまで
         while steps_todo > 0:
-            traci.simulationStep()  # simulate 1 step in sumo
+            self._traci.simulationStep()  # simulate 1 step in sumo
+            self._agents._refresh()
             # calc ped's accumulated waiting times
             self._collect_ped_waiting_times()
             # to get id that gives emergency stops
-            stop_id = list(traci.simulation.getEmergencyStoppingVehiclesIDList())
+            stop_id = list(self._traci.simulation.getEmergencyStoppingVehiclesIDList())
             self.stop += len(stop_id)
             self._step += 1  # update the step counter
             steps_todo -= 1
             queue_length = self._get_queue_length()
+            self._queue_length = queue_length
             self._sum_queue_length += queue_length
             self._sum_waiting_time += queue_length  # 1 step while wating in queue means 1 second waited, for each car, therefore queue_lenght == waited_seconds
 
 
 
+    def _jump(self, steps_todo):
+        """
+        Execute steps_todo steps with a single call and gather the statistics of those steps from the counters
+        of sumo, see detectors.py for how close they are to the ones gathered step by step
+        """
+        self._traci.simulationStep(self._step + steps_todo)
+        self._agents._refresh()
+        self._step += steps_todo
+        self._accumulate_ped_waiting_times(steps_todo)
+        emergency_stops = self._get_emergency_stops()
+        self.stop += emergency_stops - self._emergency_stops
+        self._emergency_stops = emergency_stops
+        halting_total = self._get_halting_total()
+        self._sum_queue_length += halting_total - self._halting_total
+        self._sum_waiting_time += halting_total - self._halting_total
+        self._halting_total = halting_total
+        self._queue_length = self._get_queue_length()
+
+    def _get_halting_total(self):
+        """
+        Halting vehicles of the incoming edges summed over the steps so far, weighted as in _get_queue_length
+        """
+        halting = self._traci.meandata.getAttributeValues(APPROACH_DATA, 'waitingTime')
+        # whole vehicle-steps with the default step length of 1 s
+        return int(round(sum(QUEUE_WEIGHTS[edge] * value for edge, value in zip(APPROACH_EDGES, halting))))
+
+    def _get_emergency_stops(self):
+        return int(self._traci.simulation.getParameter('', EMERGENCY_STOPS))
+
     def _collect_waiting_times(self):
         """
         Retrieve the waiting time of every car in the incoming roads
         """
         incoming_roads = ["E2TL", "N2TL", "W2TL", "S2TL", "EE2TL", "NN2TL", "WW2TL", "SS2TL"]
-        car_list = traci.vehicle.getIDList()
-        for car_id in car_list:
-            wait_time = traci.vehicle.getAccumulatedWaitingTime(car_id)
-            road_id = traci.vehicle.getRoadID(car_id)  # get the road id where the car is located
-            if road_id in incoming_roads:  # consider only the waiting times of cars in incoming roads
-                self._waiting_times[car_id] = wait_time
-            # incoming roadsに入っていない道なので、elseでもし、waiting_timesに含まれていた場合
-            # すでに交差点を抜けたことになる
-            else:
-                if car_id in self._waiting_times: # a car that was tracked has cleared the intersection
-                    del self._waiting_times[car_id]
-        total_waiting_time = sum(self._waiting_times.values())
-        return total_waiting_time
+        vehicles = self._agents.vehicles()
+        # consider only the waiting times of cars in incoming roads
+        waiting = {car_id: wait_time for car_id, (_, _, road_id, wait_time) in vehicles.items()
+                   if road_id in incoming_roads}
+        # incoming roadsに入っていない道なので、waiting_timesに含まれていた場合
+        # すでに交差点を抜けたことになる
+        # only the arrivals of the last step of a jump are reported, cars that are not seen anymore are dropped
+        self._waiting_times._set_all(waiting, vehicles, drop_unseen=self._phase_jump)
+        # cars can clear the intersection and arrive between two actions, without being seen outside of the
+        # incoming roads
+        self._waiting_times._remove_all(self._agents._take_arrived_vehicles())
+        return self._waiting_times.total
 
     def _collect_ped_waiting_times(self):
         front_area_signals = [":TL_w0_0", ":TL_w1_0", ":TL_w2_0", ":TL_w3_0"]
-        ped_list = traci.person.getIDList()
-        for ped_id in ped_list:
-            wait_time = traci.person.getWaitingTime(ped_id)
-            area = traci.person.getLaneID(ped_id)
+        persons = self._agents.persons()
+        waiting = [(ped_id, wait_time) for ped_id, (area, _, wait_time) in persons.items()
+                   if area in front_area_signals]
+        self._sum_ped_queue_length += sum(1 for _, wait_time in waiting if wait_time >= 0.1)
+        # the pedestrians that left a front area are dropped
+        self._waiting_times_ped._add_all(waiting, persons)
+        self._waiting_times_ped._remove_all(self._agents._take_arrived_persons())
+        return self._waiting_times_ped.total
+
+    def _accumulate_ped_waiting_times(self, steps):
+        """
+        What steps calls of _collect_ped_waiting_times would have added, from the waiting times after the last
+        step only: a pedestrian waiting in a front area has stood still there since its waiting time started
+        """
+        front_area_signals = [":TL_w0_0", ":TL_w1_0", ":TL_w2_0", ":TL_w3_0"]
+        persons = self._agents.persons()
+        waiting = []
+        for ped_id, (area, _, wait_time) in persons.items():
             if area in front_area_signals:
-                if wait_time >= 0.1:
-                    self._sum_ped_queue_length += 1
-                try:
-                    self._waiting_times_ped[ped_id] += wait_time
-                except:
-                    self._waiting_times_ped[ped_id] = wait_time
-            else:
-                if ped_id in self._waiting_times_ped:
-                    del self._waiting_times_ped[ped_id]
-        total_waiting_time = sum(self._waiting_times_ped.values())
-        return total_waiting_time
+                waited = min(wait_time, steps)
+                self._sum_ped_queue_length += int(waited)
+                # wait_time, wait_time - 1, ... over the steps it waited
+                waiting.append((ped_id, waited * wait_time - waited * (waited - 1) / 2))
+        # a pedestrian can leave a front area and arrive within the steps, and only the arrivals of the last
+        # step are reported, the ones that are not seen anymore are dropped
+        self._waiting_times_ped._add_all(waiting, persons, drop_unseen=True)
+        self._agents._take_arrived_persons()
+        return self._waiting_times_ped.total
 
     def _choose_action(self, states, epsilon):
         """
@@ -364,11 +575,29 @@ class Simulation:
             return np.random.choice(self._num_actions - 1)
         else:
             # the best action given the current state
-            state = T.tensor([states]).to(self.qnet_local.device)
-            actions = self.qnet_local.forward(state.float())
-            action = T.argmax(actions).item()
-            # print('Chosen Action is {}'.format(action))
-            return action
+            with self._actor_lock:
+                return self._greedy_policy()._act(states)
+
+    def _greedy_policy(self):
+        """
+        The GreedyPolicy of the actor network, built again when the actor has been replaced
+        """
+        if self._policy is None or self._policy.network is not self.qnet_actor:
+            self._policy = GreedyPolicy(self.qnet_actor, script=self._script_policy,
+                                        batch_size=self._policy_batch_size)
+        return self._policy
+
+    def _choose_actions(self, states, epsilon):
+        """
+        Epsilon-greedy actions for a batch of states, with a single forward pass for the exploitative ones
+        """
+        explore = np.random.random(len(states)) < epsilon
+        actions = np.random.choice(self._num_actions - 1, len(states))
+        if not explore.all():
+            with self._actor_lock:
+                greedy = self._greedy_policy()._act_batch(states)
+            actions = np.where(explore, actions, greedy)
+        return actions
 
     def _set_yellow_phase(self, old_action, act_bool=False):
         """
@@ -376,9 +605,9 @@ class Simulation:
         """
         if not act_bool:
             yellow_phase_code = old_action * 2 + 3  # obtain the yellow phase code, based on the old action (ref on environment.net.xml)
-            traci.trafficlight.setPhase("C", yellow_phase_code)
+            self._traci.trafficlight.setPhase("C", yellow_phase_code)
         else:
-            traci.trafficlight.setPhase("C", old_action)
+            self._traci.trafficlight.setPhase("C", old_action)
 
     def _set_green_phase(self, action_number):
         """
@@ -386,25 +615,25 @@ class Simulation:
         各方角に対して、緑信号をだす。10steps分
         """
         if action_number == 0:
-            traci.trafficlight.setPhase("C", PHASE_EW_GREEN)
+            self._traci.trafficlight.setPhase("C", PHASE_EW_GREEN)
         elif action_number == 1:
-            traci.trafficlight.setPhase("C", PHASE_NS_GREEN)
+            self._traci.trafficlight.setPhase("C", PHASE_NS_GREEN)
         elif action_number == 2:
-            traci.trafficlight.setPhase("C", PHASE_EWV_GREEN)
+            self._traci.trafficlight.setPhase("C", PHASE_EWV_GREEN)
         elif action_number == 3:
-            traci.trafficlight.setPhase("C", PHASE_NSV_GREEN)
+            self._traci.trafficlight.setPhase("C", PHASE_NSV_GREEN)
         elif action_number == 4:
-            traci.trafficlight.setPhase("C", PHASE_P_GREEN)
+            self._traci.trafficlight.setPhase("C", PHASE_P_GREEN)
 
 
     def _get_queue_length(self):
         """
         Retrieve the number of cars with speed = 0 in every incoming lane
         """
-        halt_N = traci.edge.getLastStepHaltingNumber("N2TL") + traci.edge.getLastStepHaltingNumber("NN2TL")
-        halt_S = traci.edge.getLastStepHaltingNumber("S2TL") + traci.edge.getLastStepHaltingNumber("SS2TL")
-        halt_E = traci.edge.getLastStepHaltingNumber("E2TL") + traci.edge.getLastStepHaltingNumber("NN2TL")
-        halt_W = traci.edge.getLastStepHaltingNumber("W2TL") + traci.edge.getLastStepHaltingNumber("WW2TL")
+        halt_N = self._traci.edge.getLastStepHaltingNumber("N2TL") + self._traci.edge.getLastStepHaltingNumber("NN2TL")
+        halt_S = self._traci.edge.getLastStepHaltingNumber("S2TL") + self._traci.edge.getLastStepHaltingNumber("SS2TL")
+        halt_E = self._traci.edge.getLastStepHaltingNumber("E2TL") + self._traci.edge.getLastStepHaltingNumber("NN2TL")
+        halt_W = self._traci.edge.getLastStepHaltingNumber("W2TL") + self._traci.edge.getLastStepHaltingNumber("WW2TL")
         queue_length = halt_N + halt_S + halt_E + halt_W
         return queue_length
 
@@ -415,31 +644,114 @@ class Simulation:
         if mem_cntr < self._batch_size:
             return
         # Here is kinda fishy
+        # the batch is a copy, the learning step runs without the lock
+        with self._Memory._lock:
+            batch, weights = self._Memory._sample(self._batch_size)
+            sample = self._Memory._get_batch(batch)
+        state_batch = T.tensor(sample.get('state')).to(self.qnet_local.device)
+        new_state_batch = T.tensor(sample.get('new_state')).to(self.qnet_local.device)
+        reward_batch = T.tensor(sample.get('reward')['reward']).to(self.qnet_local.device)
+        action_batch = T.tensor(sample.get('action')).long().to(self.qnet_local.device)
+        if weights is not None:
+            weights = T.tensor(weights).to(self.qnet_local.device)
+        self._learn_batch(batch, state_batch.float(), new_state_batch.float(), reward_batch, action_batch, weights)
+
+    def _learn_epochs(self, epochs):
+        """
+        Run the training epochs on batches that are sampled, gathered and moved to the device all at once
+        """
+        if self._Memory._get_counter() < self._batch_size:
+            return
+        with self._Memory._lock:
+            batches, weights = self._Memory._sample_epochs(epochs, self._batch_size)
+            batches = batches.ravel()
+            sample = self._Memory._get_batch(batches)
+        if weights is not None:
+            weights = weights.ravel()
+        state = self._to_device('state', sample.get('state'))
+        new_state = self._to_device('new_state', sample.get('new_state'))
+        reward = self._to_device('reward', sample.get('reward')['reward'])
+        action = self._to_device('action', sample.get('action')).long()
+        if weights is not None:
+            weights = self._to_device('weights', weights)
+        for epoch in range(epochs):
+            rows = slice(epoch * self._batch_size, (epoch + 1) * self._batch_size)
+            self._learn_batch(batches[rows], state[rows], new_state[rows], reward[rows], action[rows],
+                              None if weights is None else weights[rows])
+
+    def _to_device(self, name, array):
+        """
+        Float tensor on the device, staged through a preallocated pinned buffer when the device is a gpu
+        """
+        tensor = T.from_numpy(np.ascontiguousarray(array))
+        if self.qnet_local.device.type == 'cuda':
+            buffer = self._pinned.get(name)
+            if buffer is None or buffer.shape != tensor.shape or buffer.dtype != tensor.dtype:
+                buffer = T.empty(tensor.shape, dtype=tensor.dtype).pin_memory()
+                self._pinned[name] = buffer
+            buffer.copy_(tensor)
+            tensor = buffer.to(self.qnet_local.device, non_blocking=True)
+        return tensor.float()
+
+    def _learn_batch(self, batch, state_batch, new_state_batch, reward_batch, action_batch, weights):
+        """
+        One optimizer step on a batch that is already on the device
+        """
         self.qnet_local.optimizer.zero_grad()
-        max_mem = min(mem_cntr, self._max_mem_size)
-        batch = np.random.choice(max_mem, self._batch_size, replace=False)
-
-        batch_index = np.arange(self._batch_size, dtype=np.int32)
-
-        sample = self._Memory._get_sample()
-        state_batch = T.tensor(sample.get('state')[batch]).to(self.qnet_local.device)
-        new_state_batch = T.tensor(sample.get('new_state')[batch]).to(self.qnet_local.device)
-        reward_batch = T.tensor(sample.get('reward')['reward'][batch]).to(self.qnet_local.device)
-        action_batch = sample.get('action')[batch]
-        q_expected = self.qnet_local.forward(state_batch.float())[batch_index, action_batch]
-        q_target_next = self.qnet_target.forward(new_state_batch.float())
-
-        q_target = reward_batch + self.gamma * T.max(q_target_next, dim=1)[0]
+        batch_index = T.arange(len(action_batch), device=action_batch.device)
+        q_expected = self.qnet_local.forward(state_batch)[batch_index, action_batch]
+        with T.no_grad():
+            q_target_next = self.qnet_target.forward(new_state_batch)
+            if self._double_dqn:
+                # the local network picks the next action, the target network evaluates it
+                next_action = T.argmax(self.qnet_local.forward(new_state_batch), dim=1)
+                q_next = q_target_next[batch_index, next_action]
+            else:
+                q_next = T.max(q_target_next, dim=1)[0]
+        q_target = reward_batch + self.gamma * q_next
 
-        loss = self.qnet_local.loss(q_target, q_expected).to(self.qnet_local.device)
+        if weights is None:
+            loss = self.qnet_local.loss(q_target, q_expected).to(self.qnet_local.device)
+        else:
+            # prioritized replay: scale the squared TD errors by the importance-sampling weights
+            td_errors = q_target - q_expected
+            loss = (weights * td_errors ** 2).mean()
+            with self._Memory._lock:
+                self._Memory._update_priorities(batch, td_errors.detach().cpu().numpy())
         loss.backward()
         self.qnet_local.optimizer.step()
-        self.soft_update(self.qnet_local, self.qnet_target, self.tau)
+        self._learn_steps += 1
+        if self._target_update_interval == 0:
+            self.soft_update(self.qnet_local, self.qnet_target, self.tau)
+        elif self._learn_steps % self._target_update_interval == 0:
+            self.soft_update(self.qnet_local, self.qnet_target, 1.0)
 
     def soft_update(self, local_model, target_model, tau):
+        """
+        target = tau * local + (1 - tau) * target over all the parameters in one fused operation
+        """
+        with T.no_grad():
+            T._foreach_lerp_(list(target_model.parameters()), list(local_model.parameters()), tau)
 
-        for target_param, local_param in zip(target_model.parameters(), local_model.parameters()):
-            target_param.data.copy_(tau*local_param.data + (1.0 - tau)*target_param.data)
+    def _training_state(self):
+        """
+        Copy of the networks, optimizer and episode stats, to be written in a checkpoint
+        """
+        return {'qnet_local': copy.deepcopy(self.qnet_local.state_dict()),
+                'qnet_target': copy.deepcopy(self.qnet_target.state_dict()),
+                'optimizer': copy.deepcopy(self.qnet_local.optimizer.state_dict()),
+                'learn_steps': self._learn_steps,
+                'stores': {name: list(value) for name, value in vars(self).items() if name.endswith('_store')}}
+
+    def _load_training_state(self, state):
+        self.qnet_local.load_state_dict(state['qnet_local'])
+        self.qnet_target.load_state_dict(state['qnet_target'])
+        self.qnet_local.optimizer.load_state_dict(state['optimizer'])
+        self._learn_steps = state['learn_steps']
+        for name, value in state['stores'].items():
+            setattr(self, name, list(value))
+        if self._learner is not None:
+            self._learner._publish()
 
     def _save_episode_stats(self):
         """
@@ -449,10 +761,22 @@ class Simulation:
         self._veh_reward_store.append(self._sum_neg_veh_reward)
         self._ped_reward_store.append(self._sum_neg_ped_reward)
         self._cumulative_wait_store.append(self._sum_waiting_time)  # total number of seconds waited by cars in this episode
-        self._avg_queue_length_store.append(self._sum_queue_length / self._max_steps)  # average number of queued cars per step, in this episode
-        self._avg_ped_queue_length_store.append(self._sum_ped_queue_length / self._max_steps)
-
+        # averages over the steps actually run, an episode ended early is compared on the same footing
+        steps = max(self._step - self._start_step, 1)
+        self._avg_queue_length_store.append(self._sum_queue_length / steps)  # average number of queued cars per step, in this episode
+        self._avg_ped_queue_length_store.append(self._sum_ped_queue_length / steps)
+        self._steps_store.append(steps)
+        self._traci_calls_store.append(self._traci.calls)  # round-trips to sumo in this episode
+        return self._get_episode_stats()
+
+    def _get_episode_stats(self):
+        """
+        Return the stats of all the episodes so far
+        """
         result = {'reward': self._reward_store, 'reward_veh': self._veh_reward_store, 'reward_ped': self._ped_reward_store,
                   'cumulative_wait': self._cumulative_wait_store, 'avg_queue_len': self._avg_queue_length_store,
-                  'avg_ped_queue_len': self._avg_ped_queue_length_store}
+                  'avg_ped_queue_len': self._avg_ped_queue_length_store, 'traci_calls': self._traci_calls_store,
+                  'steps': self._steps_store}
+        if self._output_files is not None:
+            result['kpi'] = self._kpi_store
         return result
@@ -0,0 +1,34 @@
+import os
+
+
+class SnapshotLibrary:
+    """
+    Sumo states saved after warm_up seconds of every seed, so that an episode can start with the traffic of the
+    ramp-up already in the network instead of the empty intersection. The warm-up runs the static program of
+    the traffic light, the saved state of the pedestrians is experimental in sumo and not exactly restored.
+    From the second warm-started episode of a process libsumo drifts from traci, Simulation runs snapshots with
+    traci only
+    """
+    # options sumo needs to save the pedestrians and the random states along with the vehicles
+    save_options = ['--save-state.transportables', '--save-state.rng']
+
+    def __init__(self, TrafficGen, path, warm_up):
+        self._TrafficGen = TrafficGen
+        self._path = path
+        self.warm_up = warm_up
+        os.makedirs(path, exist_ok=True)
+
+    def _snapshot_file(self, seed):
+        # the digest covers every parameter of the routes, max_steps included
+        key = (seed, self._TrafficGen._digest(), self.warm_up)
+        return os.path.join(self._path, 'state_s{}_{}_w{}.xml.gz'.format(*key))
+
+    def _save(self, conn, snapshot_file):
+        """
+        Run the warm-up in the sumo of conn, that just started the episode, and save its state
+        """
+        conn.simulationStep(self.warm_up)
+        # saved under a temporary name first, an interrupted save is not mistaken for a snapshot
+        tmp_file = snapshot_file.replace('.xml.gz', '.tmp.xml.gz')
+        conn.simulation.saveState(tmp_file)
+        os.replace(tmp_file, snapshot_file)
@@ -0,0 +1,104 @@
+import numpy as np
+
+# lane id -> lane group of the incoming vehicles, x2TL_3 are the "turn left only" lanes
+VEH_LANE_GROUPS = {
+    'W2TL_1': 0, 'W2TL_2': 0, 'WW2TL_1': 0, 'WW2TL_2': 0,
+    'W2TL_3': 1, 'WW2TL_3': 1,
+    'N2TL_1': 2, 'N2TL_2': 2, 'NN2TL_1': 2, 'NN2TL_2': 2,
+    'N2TL_3': 3, 'NN2TL_3': 3,
+    'E2TL_1': 4, 'E2TL_2': 4, 'EE2TL_1': 4, 'EE2TL_2': 4,
+    'E2TL_3': 5, 'EE2TL_3': 5,
+    'S2TL_1': 6, 'S2TL_2': 6, 'SS2TL_1': 6, 'SS2TL_2': 6,
+    'S2TL_3': 7, 'SS2TL_3': 7,
+}
+VEH_CELLS = 10
+# upper edges (in meters from the traffic light) of the cells: 5m, then 10m, then 20m intervals
+VEH_CELL_EDGES = np.array([5, 10, 15, 20, 25, 35, 45, 65, 85, 100], dtype=np.float64)
+VEH_LANE_LENGTH = 100
+VEH_STATES = 8 * VEH_CELLS
+
+# lane id -> (offset in the pedestrian state, cell size in meters, number of cells, clip to the last cell)
+# |w_state| = 4 * 10 = 40, |c_state| = 4 * 9 = 36, |xc_state| = 2 * 15 = 30 -> 106
+# crossings are compared against the ids without the leading ':' that sumo reports, as the encoding always did
+PED_LANES = {
+    ':TL_w0_0': (0, 1, 10, True),
+    ':TL_w1_0': (10, 1, 10, True),
+    ':TL_w2_0': (20, 1, 10, True),
+    ':TL_w3_0': (30, 1, 10, True),
+    'TL_c1_0': (40, 2, 9, False),
+    'TL_c3_0': (49, 2, 9, False),
+    'TL_c4_0': (58, 2, 9, False),
+    'TL_c5_0': (67, 2, 9, False),
+    # for scramble crossing
+    'TL_c0_0': (76, 2, 15, False),
+    'TL_c2_0': (91, 2, 15, False),
+}
+PED_STATES = 106
+
+
+class StateEncoder:
+    """
+    Table driven encoding of the vehicles and pedestrians into the binary cell occupancy state
+    """
+    def __init__(self, num_states_veh=VEH_STATES, num_states_ped=PED_STATES):
+        self._state = np.zeros(num_states_veh + num_states_ped, dtype=np.uint8)
+        self._veh_state = self._state[:num_states_veh]
+        self._ped_state = self._state[num_states_veh:]
+
+        self._ped_lanes = {lane_id: k for k, lane_id in enumerate(PED_LANES)}
+        offset, cell_size, n_cells, clip = zip(*PED_LANES.values())
+        self._ped_offset = np.array(offset, dtype=np.int64)
+        self._ped_cell_size = np.array(cell_size, dtype=np.float64)
+        self._ped_n_cells = np.array(n_cells, dtype=np.int64)
+        self._ped_clip = np.array(clip, dtype=bool)
+
+    def encode(self, vehicles, persons):
+        """
+        :param vehicles: sequence of (lane id, lane position, ...) of every vehicle
+        :param persons: sequence of (lane id, lane position, ...) of every pedestrian
+        :return: uint8 array, vehicle state followed by pedestrian state
+        """
+        self._fill_veh(vehicles)
+        self._fill_ped(persons)
+        return self._state.copy()
+
+    def encode_veh(self, vehicles):
+        self._fill_veh(vehicles)
+        return self._veh_state.copy()
+
+    def encode_ped(self, persons):
+        self._fill_ped(persons)
+        return self._ped_state.copy()
+
+    def _fill_veh(self, vehicles):
+        state = self._veh_state
+        state.fill(0)
+        n = len(vehicles)
+        if n == 0:
+            return
+        groups = np.fromiter((VEH_LANE_GROUPS.get(agent[0], -1) for agent in vehicles), np.int64, n)
+        lane_pos = np.fromiter((agent[1] for agent in vehicles), np.float64, n)
+        # distance in meters from the traffic light -> mapping into cells
+        cells = np.searchsorted(VEH_CELL_EDGES, VEH_LANE_LENGTH - lane_pos, side='right')
+        # cars crossing the intersection or driving away from it are not detected, nor a car exactly at the start
+        # of a lane (100 m away), which the if/elif encoding wrote into state[-1] for the W lanes and failed on for
+        # the others. sumo inserts cars with their front at least one car length into the lane
+        valid = (groups >= 0) & (cells < VEH_CELLS)
+        state[groups[valid] * VEH_CELLS + cells[valid]] = 1
+
+    def _fill_ped(self, persons):
+        state = self._ped_state
+        state.fill(0)
+        n = len(persons)
+        if n == 0:
+            return
+        lanes = np.fromiter((self._ped_lanes.get(agent[0], -1) for agent in persons), np.int64, n)
+        lane_pos = np.fromiter((agent[1] for agent in persons), np.float64, n)
+        known = lanes >= 0
+        lanes = lanes[known]
+        n_cells = self._ped_n_cells[lanes]
+        cells = (lane_pos[known] // self._ped_cell_size[lanes]).astype(np.int64)
+        # pedestrians further than the last cell of a waiting area are put into the last cell
+        cells = np.where(self._ped_clip[lanes], np.minimum(cells, n_cells - 1), cells)
+        valid = (cells >= 0) & (cells < n_cells)
+        state[self._ped_offset[lanes][valid] + cells[valid]] = 1
@@ -0,0 +1,35 @@
+from collections import deque
+
+
+class SteadyStateDetector:
+    """
+    Tells when the queue length and the growth of the waiting time per step have stayed within tolerance of
+    their mean for the last window decisions, as in a gridlock where the same vehicles keep waiting
+    """
+    def __init__(self, window, tolerance):
+        self._window = window
+        self._tolerance = tolerance
+        self._reset()
+
+    def _reset(self):
+        self._queue_lengths = deque(maxlen=self._window)
+        self._wait_rates = deque(maxlen=self._window)
+        self._last = None
+
+    def _update(self, step, queue_length, total_wait):
+        """
+        Add the observation of a decision
+        :return: True once the last window decisions are steady
+        """
+        if self._last is not None and step > self._last[0]:
+            last_step, last_wait = self._last
+            self._queue_lengths.append(queue_length)
+            self._wait_rates.append((total_wait - last_wait) / (step - last_step))
+        self._last = (step, total_wait)
+        return (len(self._queue_lengths) == self._window and self._steady(self._queue_lengths)
+                and self._steady(self._wait_rates))
+
+    def _steady(self, values):
+        mean = sum(values) / len(values)
+        # relative to the mean, with an absolute floor of tolerance for values around 0
+        return max(values) - min(values) <= self._tolerance * max(abs(mean), 1)
@@ -0,0 +1,159 @@
+import traci.constants as tc
+
+# the whole scenario fits into this radius (in meters) around the centre junction
+CONTEXT_RANGE = 1000
+
+VEH_VARS = [tc.VAR_LANE_ID, tc.VAR_LANEPOSITION, tc.VAR_ROAD_ID, tc.VAR_ACCUMULATED_WAITING_TIME]
+PED_VARS = [tc.VAR_LANE_ID, tc.VAR_LANEPOSITION, tc.VAR_WAITING_TIME]
+ARRIVAL_VARS = [tc.VAR_ARRIVED_VEHICLES_IDS, tc.VAR_ARRIVED_PERSONS_IDS]
+
+# domains of a TraCI connection whose calls are counted
+DOMAINS = ('simulation', 'vehicle', 'person', 'edge', 'lane', 'junction', 'trafficlight',
+           'lanearea', 'multientryexit', 'inductionloop', 'meandata')
+
+# subscription results are read from the client side buffer and never reach SUMO
+LOCAL_CALLS = ('getSubscriptionResults', 'getAllSubscriptionResults',
+               'getContextSubscriptionResults', 'getAllContextSubscriptionResults')
+
+
+class TraciCounter:
+    """
+    Wrapper around a TraCI connection (module or labeled connection) counting the round-trips to SUMO,
+    and timing them per command when a profiler is given
+    """
+    def __init__(self, conn, profiler=None):
+        self._conn = conn
+        self._profiler = profiler
+        self._domains = {}
+        self.calls = 0
+
+    def __getattr__(self, name):
+        if name in DOMAINS:
+            if name not in self._domains:
+                self._domains[name] = _DomainCounter(self, name, getattr(self._conn, name))
+            return self._domains[name]
+        attr = getattr(self._conn, name)
+        if callable(attr):
+            return self._counted(attr, name)
+        return attr
+
+    def _counted(self, func, command):
+        if self._profiler is not None:
+            func = self._profiler._timed('traci.' + command, func)
+
+        def call(*args, **kwargs):
+            self.calls += 1
+            return func(*args, **kwargs)
+        return call
+
+
+class _DomainCounter:
+    def __init__(self, counter, name, domain):
+        self._counter = counter
+        self._name = name
+        self._domain = domain
+
+    def __getattr__(self, name):
+        attr = getattr(self._domain, name)
+        if callable(attr) and name not in LOCAL_CALLS:
+            return self._counter._counted(attr, self._name + '.' + name)
+        return attr
+
+
+class AgentCache:
+    """
+    Context subscriptions around the centre junction that fetch lane, position, road and waiting time
+    of every vehicle and pedestrian in one bulk result, and a subscription to the vehicles and pedestrians
+    that arrived, which come back with every step without a call of their own
+    """
+    def __init__(self, junction_id='TL', context_range=CONTEXT_RANGE):
+        self._junction_id = junction_id
+        self._context_range = context_range
+        self._conn = None
+        self._vehicles = None
+        self._persons = None
+        self._live = None
+        # arrivals of the steps since they were last taken
+        self._arrived_vehicles = []
+        self._arrived_persons = []
+
+    def _subscribe(self, conn, loaded_state=False):
+        """
+        Register the pedestrian subscription, to be called once after the connection to SUMO is opened or reloaded
+        :param loaded_state: sumo starts from a saved state that already holds agents
+        """
+        self._conn = conn
+        conn.junction.subscribeContext(self._junction_id, tc.CMD_GET_PERSON_VARIABLE, self._context_range, PED_VARS)
+        conn.simulation.subscribe(ARRIVAL_VARS)
+        # results read before the first step can be left over from the previous episode (traci keeps them after
+        # a load, libsumo even after a restart)
+        if loaded_state:
+            # they are filtered with the agents that are really there
+            self._refresh()
+            self._live = set(conn.vehicle.getIDList()) | set(conn.person.getIDList())
+        else:
+            # sumo inserts the first agents during the first step
+            self._vehicles = {}
+            self._persons = {}
+        self._arrived_vehicles = []
+        self._arrived_persons = []
+
+    def _refresh(self):
+        """
+        Invalidate the cached agents and keep the arrivals of the step, to be called after every simulation step.
+        A step to a later time only reports the arrivals of its last step
+        """
+        self._vehicles = None
+        self._persons = None
+        self._live = None
+        arrivals = self._conn.simulation.getSubscriptionResults() or {}
+        self._arrived_vehicles.extend(arrivals.get(tc.VAR_ARRIVED_VEHICLES_IDS, ()))
+        self._arrived_persons.extend(arrivals.get(tc.VAR_ARRIVED_PERSONS_IDS, ()))
+
+    def _take_arrived_vehicles(self):
+        """
+        :return: ids of the vehicles that arrived since the last call
+        """
+        arrived, self._arrived_vehicles = self._arrived_vehicles, []
+        return arrived
+
+    def _take_arrived_persons(self):
+        """
+        :return: ids of the pedestrians that arrived since the last call
+        """
+        arrived, self._arrived_persons = self._arrived_persons, []
+        return arrived
+
+    def _results(self):
+        # both contexts share the junction, so vehicles and persons come back merged in one dict
+        results = self._conn.junction.getContextSubscriptionResults(self._junction_id) or {}
+        if self._live is not None:
+            results = {agent_id: values for agent_id, values in results.items() if agent_id in self._live}
+        return results
+
+    def vehicles(self):
+        """
+        :return: dict vehicle id -> (lane id, lane position, road id, accumulated waiting time)
+        """
+        if self._vehicles is None:
+            # vehicles are only needed once per action, so the subscription answers a single step
+            # and is dropped again instead of being parsed after every simulation step
+            self._conn.junction.subscribeContext(self._junction_id, tc.CMD_GET_VEHICLE_VARIABLE,
+                                                 self._context_range, VEH_VARS)
+            self._conn.junction.unsubscribeContext(self._junction_id, tc.CMD_GET_VEHICLE_VARIABLE,
+                                                   self._context_range)
+            self._vehicles = {veh_id: (values[tc.VAR_LANE_ID], values[tc.VAR_LANEPOSITION],
+                                       values[tc.VAR_ROAD_ID], values[tc.VAR_ACCUMULATED_WAITING_TIME])
+                              for veh_id, values in self._results().items()
+                              if tc.VAR_ACCUMULATED_WAITING_TIME in values}
+        return self._vehicles
+
+    def persons(self):
+        """
+        :return: dict person id -> (lane id, lane position, waiting time)
+        """
+        if self._persons is None:
+            self._persons = {ped_id: (values[tc.VAR_LANE_ID], values[tc.VAR_LANEPOSITION], values[tc.VAR_WAITING_TIME])
+                             for ped_id, values in self._results().items()
+                             if tc.VAR_ACCUMULATED_WAITING_TIME not in values}
+        return self._persons
@@ -0,0 +1,123 @@
+import os
+import xml.etree.ElementTree as ET
+
+# attributes of the tripinfo and personinfo elements that are aggregated per episode
+TRIP_ATTRIBUTES = ['duration', 'waitingTime', 'timeLoss']
+SUMMARY_ATTRIBUTES = ['running', 'halting', 'meanSpeed']
+EDGE_ATTRIBUTES = ['sampledSeconds', 'waitingTime', 'timeLoss']
+
+
+def output_files(path, label):
+    """
+    Files the outputs of the sumo behind label are written to, each episode overwrites the previous one
+    """
+    return {kind: os.path.join(path, '{}_{}.xml'.format(kind, label)) for kind in ['tripinfo', 'summary', 'edgedata']}
+
+
+def output_options(files):
+    """
+    Sumo options that write the outputs to files, the vehicles still running at the end are written too
+    """
+    return ['--tripinfo-output', files['tripinfo'], '--tripinfo-output.write-unfinished', 'true',
+            '--summary-output', files['summary'], '--edgedata-output', files['edgedata']]
+
+
+def iter_elements(filename, tags):
+    """
+    Yield the elements of filename with one of tags as soon as they are parsed, then clear and drop them so
+    that memory does not grow with the file. An element is only valid until the next one is yielded
+    """
+    parents = []
+    for event, element in ET.iterparse(filename, events=('start', 'end')):
+        if event == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if element.tag in tags:
+            yield element
+            element.clear()
+            if parents:
+                # the element is the last child of its parent, removing it is O(1)
+                parents[-1].remove(element)
+
+
+class RunningStats:
+    """
+    Count, mean and max of some attributes over a stream of elements, in constant memory
+    """
+    def __init__(self, attributes):
+        self._attributes = attributes
+        self.count = 0
+        self._sums = dict.fromkeys(attributes, 0.0)
+        self._maxs = dict.fromkeys(attributes, 0.0)
+
+    def _add(self, element):
+        self.count += 1
+        for attribute in self._attributes:
+            value = float(element.get(attribute))
+            self._sums[attribute] += value
+            if value > self._maxs[attribute]:
+                self._maxs[attribute] = value
+
+    def _result(self, prefix):
+        result = {prefix + '_count': self.count}
+        for attribute in self._attributes:
+            result['{}_{}_mean'.format(prefix, attribute)] = self._sums[attribute] / self.count if self.count else 0.0
+            result['{}_{}_max'.format(prefix, attribute)] = self._maxs[attribute]
+        return result
+
+
+def parse_tripinfo(filename):
+    """
+    Travel time (duration), waiting time and time loss of the vehicles and of the pedestrians
+    """
+    vehicles = RunningStats(TRIP_ATTRIBUTES)
+    persons = RunningStats(TRIP_ATTRIBUTES)
+    unfinished = 0
+    for element in iter_elements(filename, ('tripinfo', 'personinfo')):
+        if element.tag == 'tripinfo':
+            vehicles._add(element)
+            if element.get('vaporized') == 'end':
+                unfinished += 1
+        else:
+            persons._add(element)
+    result = vehicles._result('veh')
+    result.update(persons._result('ped'))
+    result['veh_unfinished'] = unfinished
+    return result
+
+
+def parse_summary(filename):
+    """
+    Running and halting vehicles and mean speed over the steps, arrivals at the last step
+    """
+    steps = RunningStats(SUMMARY_ATTRIBUTES)
+    arrived = 0
+    for element in iter_elements(filename, ('step',)):
+        steps._add(element)
+        arrived = int(element.get('arrived'))
+    result = steps._result('step')
+    result['arrived'] = arrived
+    return result
+
+
+def parse_edgedata(filename, edges):
+    """
+    Sampled seconds, waiting time and time loss summed over the intervals and over edges
+    """
+    totals = dict.fromkeys(EDGE_ATTRIBUTES, 0.0)
+    for element in iter_elements(filename, ('edge',)):
+        if element.get('id') in edges:
+            for attribute in EDGE_ATTRIBUTES:
+                totals[attribute] += float(element.get(attribute, 0))
+    return {'edges_' + attribute: value for attribute, value in totals.items()}
+
+
+def parse_outputs(files, edges):
+    """
+    Episode KPIs from the outputs of a sumo that has been closed
+    """
+    kpis = parse_tripinfo(files['tripinfo'])
+    kpis.update(parse_summary(files['summary']))
+    kpis.update(parse_edgedata(files['edgedata'], edges))
+    return kpis
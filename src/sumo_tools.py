@@ -0,0 +1,13 @@
+import os
+import sys
+
+
+def add_sumo_tools():
+    """
+    Put the python tools of sumo (traci, sumolib) found under SUMO_HOME on the path, before they are imported
+    """
+    if 'SUMO_HOME' not in os.environ:
+        sys.exit("please declare environment variable 'SUMO_HOME'")
+    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
+    if tools not in sys.path:
+        sys.path.append(tools)
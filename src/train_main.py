@@ -2,6 +2,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 import os
 import sys
+import argparse
 import datetime
 import numpy as np
 import torch as T
@@ -10,11 +11,8 @@ import warnings
 warnings.simplefilter('ignore')
 
 # FOR SIT PC
-if 'SUMO_HOME' in os.environ:
-    tools = os.path.join(os.environ['SUMO_HOME'], 'tools')
-    sys.path.append(tools)
-else:
-    sys.exit("please declare environment variable 'SUMO_HOME'")
+from sumo_tools import add_sumo_tools
+add_sumo_tools()
 
 # FOR my ubuntu laptop
 # os.system("export SUMO_HOME=/usr/share/sumo")
@@ -23,20 +21,38 @@ else:
 # except ImportError:
 #     sys.exit("please declare environment variable 'SUMO_HOME' as the root directory of your sumo installation (it should contain folders 'bin', 'tools' and 'docs')")
 from simulation import Simulation
-from utils import import_train_configuration, set_sumo, set_train_path
+from vec_simulation import VecSimulation
+from utils import import_train_configuration, set_sumo, set_train_path, set_backend
 from gen_vp import TrafficGenerator
 # from dqn_net import DeepQNetwork
 from ddqn_net import DeepQNetwork
-from memory import Memory
+from memory import Memory, CompactMemory, PrioritizedMemory
 from visual import Visualization
+from checkpoint import Checkpointer
+from route_cache import RouteCache
+from snapshot import SnapshotLibrary
+from profiler import Profiler
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--resume', metavar='MODEL_PATH',
+                        help='continue the training from the last checkpoint of this model path')
+    args = parser.parse_args()
+
     config = import_train_configuration(config_file='sim.ini')
     sumo_cmd_f = set_sumo(config['gui'], config['sumocfg_file_name'], config['max_steps'])
-    path = set_train_path(config['models_path_name'])
+    if args.resume:
+        if not os.path.isdir(args.resume):
+            sys.exit('No model path {} to resume from'.format(args.resume))
+        path = os.path.join(os.path.abspath(args.resume), '')
+    else:
+        path = set_train_path(config['models_path_name'])
 
     print('config:{}'.format(config))
     print('sumo_cmd:{}'.format(sumo_cmd_f))
+    # threads of the forward and backward passes, 0 keeps the torch default of one per core
+    if config['torch_threads'] > 0:
+        T.set_num_threads(config['torch_threads'])
 
     TrafficGen = TrafficGenerator(
         max_steps=config['max_steps'],
@@ -44,11 +60,60 @@ if __name__ == '__main__':
         n_peds_generated=config['n_peds_generated']
     )
 
-    Memory = Memory(
-        state_size=config['num_states'],
-        max_mem_size=config['max_mem_size'],
-        num_act=5
-    )
+    # with a lookahead the routes of the next episodes are generated in the background and cached per seed
+    route_cache = None
+    if config['route_lookahead'] > 0:
+        if config['route_cache_size'] <= config['route_lookahead'] + config['n_envs']:
+            sys.exit('route_cache_size must be larger than route_lookahead + n_envs')
+        route_cache = RouteCache(
+            TrafficGen,
+            path=config['route_cache_path_name'],
+            lookahead=config['route_lookahead'],
+            max_size=config['route_cache_size'],
+            workers=config['route_workers']
+        )
+
+    # with a warm-up the episodes start from the state saved after warm_up seconds of their seed
+    snapshots = None
+    if config['warm_up'] > 0:
+        if config['warm_up'] >= config['max_steps']:
+            sys.exit('warm_up must be shorter than max_steps')
+        snapshots = SnapshotLibrary(TrafficGen, path=config['snapshot_path_name'], warm_up=config['warm_up'])
+
+    # a persistent memory lives in memory-mapped files, an existing memory_path_name is reopened to resume
+    memory_path = None
+    if config['persistent_memory']:
+        memory_path = config['memory_path_name'] or os.path.join(path, 'memory')
+    try:
+        if config['prioritized_memory']:
+            Memory = PrioritizedMemory(
+                state_size=config['num_states'],
+                max_mem_size=config['max_mem_size'],
+                num_act=5,
+                alpha=config['alpha'],
+                beta=config['beta'],
+                beta_increment=config['beta_increment'],
+                path=memory_path
+            )
+        elif config['compact_memory']:
+            Memory = CompactMemory(
+                state_size=config['num_states'],
+                max_mem_size=config['max_mem_size'],
+                num_act=5,
+                path=memory_path,
+                legacy_sampling=config['legacy_sampling']
+            )
+        else:
+            Memory = Memory(
+                state_size=config['num_states'],
+                max_mem_size=config['max_mem_size'],
+                num_act=5,
+                path=memory_path,
+                legacy_sampling=config['legacy_sampling']
+            )
+    except ValueError as error:
+        # a memory path written with another memory configuration
+        sys.exit(str(error))
 
     Model = DeepQNetwork(
         lr=config['lr'],
@@ -59,7 +124,7 @@ if __name__ == '__main__':
         fc3_dims=config['fc3_dims'],
         n_actions=config['num_actions']
     )
-    Simulation = Simulation(
+    sim_params = dict(
         Model=Model,
         Memory=Memory,
         TrafficGen=TrafficGen,
@@ -79,15 +144,44 @@ if __name__ == '__main__':
         epsilon_end=config['epsilon_end'],
         epsilon_dec=config['epsilon_dec'],
         tau=config['tau'],
-        max_mem_size=config['max_mem_size']
+        max_mem_size=config['max_mem_size'],
+        backend=set_backend(config['backend'], config['gui']),
+        async_learning=config['async_learning'],
+        publish_interval=config['publish_interval'],
+        fused_learning=config['fused_learning'],
+        double_dqn=config['double_dqn'],
+        target_update_interval=config['target_update_interval'],
+        route_cache=route_cache,
+        episodes_per_sumo=config['episodes_per_sumo'],
+        pipeline=config['pipeline'],
+        total_episodes=config['total_episodes'],
+        snapshots=snapshots,
+        early_termination=config['early_termination'],
+        steady_window=config['steady_window'],
+        steady_tolerance=config['steady_tolerance'],
+        phase_jump=config['phase_jump'],
+        output_path=os.path.join(path, 'sumo_outputs') if config['sumo_outputs'] else None,
+        profiler=Profiler(os.path.join(path, 'profile'), trace=config['profile_trace']) if config['profile'] else None,
+        script_policy=config['script_policy']
     )
+    if config['n_envs'] > 1:
+        Simulation = VecSimulation(n_envs=config['n_envs'], **sim_params)
+    else:
+        Simulation = Simulation(**sim_params)
 
     Visualization = Visualization(
         path,
         dpi=96
     )
 
-    episode = 0
+    Checkpointer = Checkpointer(
+        os.path.join(path, 'checkpoints'),
+        interval=config['checkpoint_interval'],
+        keep_last=config['keep_last'],
+        keep_best=config['keep_best']
+    )
+
+    episode = Checkpointer._load(Simulation, Memory) if args.resume else 0
     timestamp_start = datetime.datetime.now()
 
     while episode < config['total_episodes']:
@@ -97,17 +191,29 @@ if __name__ == '__main__':
 
         print('Simulation time:', simulation_time, 's - Training time:', 's - Total:',
               np.round(simulation_time, 1), 's')
-        episode += 1
+        episode += config['n_envs']
+        Checkpointer._save(episode, epsilon, Simulation, Memory, final=episode >= config['total_episodes'])
 
+    Simulation._close_sumo()
+    Checkpointer._close()
+    if route_cache is not None:
+        route_cache._close()
     print("\n----- Start time:", timestamp_start)
     print("----- End time:", datetime.datetime.now())
 
     # T.save(Model.state_dict(), os.path.join(path, 'trained_model.pth'))
     T.save(Model, os.path.join(path, 'trained_model.pth'))
-    result_data = Simulation._save_episode_stats()
+    # the weights alone, as loaded by controller.py
+    T.save(Model.state_dict(), os.path.join(path, 'trained_model_state.pth'))
+    result_data = Simulation._get_episode_stats()
     Visualization.save_data_and_plotly_data(reward_data=result_data['reward'], x_rng=config['total_episodes'], reward_ped_data=None, filename='reward')
     Visualization.save_data_and_plotly_data(reward_data=result_data['reward_veh'], reward_ped_data=result_data['reward_ped'], x_rng=config['total_episodes'], filename='reward', multi=True)
     Visualization.save_data_and_plot(data=result_data['avg_queue_len'], filename='queue', xlabel='Episode',
                                      ylabel='Average queue length (vehicles)')
     Visualization.save_data_and_plot(data=result_data['avg_ped_queue_len'], filename='queue_ped', xlabel='Episode',
                                      ylabel='Average queue length (pedestrians)')
+    if config['sumo_outputs']:
+        Visualization.save_data_and_plot(data=[kpi['veh_timeLoss_mean'] for kpi in result_data['kpi']],
+                                         filename='time_loss', xlabel='Episode', ylabel='Mean time loss (s)')
+        Visualization.save_data_and_plot(data=[kpi['ped_waitingTime_mean'] for kpi in result_data['kpi']],
+                                         filename='wait_ped', xlabel='Episode', ylabel='Mean pedestrian waiting time (s)')
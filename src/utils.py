@@ -21,6 +21,21 @@ def import_train_configuration(config_file):
     config['yellow_duration'] = content['simulation'].getint('yellow_duration')
     config['ped_yellow_duration'] = content['simulation'].getint('ped_yellow_duration')
     config['batch_size'] = content['simulation'].getint('batch_size')
+    config['n_envs'] = content['simulation'].getint('n_envs')
+    config['backend'] = content['simulation']['backend']
+    config['route_lookahead'] = content['simulation'].getint('route_lookahead')
+    config['route_cache_size'] = content['simulation'].getint('route_cache_size')
+    config['route_workers'] = content['simulation'].getint('route_workers')
+    config['episodes_per_sumo'] = content['simulation'].getint('episodes_per_sumo')
+    config['pipeline'] = content['simulation'].getboolean('pipeline')
+    config['warm_up'] = content['simulation'].getint('warm_up')
+    config['early_termination'] = content['simulation'].getboolean('early_termination')
+    config['steady_window'] = content['simulation'].getint('steady_window')
+    config['steady_tolerance'] = content['simulation'].getfloat('steady_tolerance')
+    config['phase_jump'] = content['simulation'].getboolean('phase_jump')
+    config['sumo_outputs'] = content['simulation'].getboolean('sumo_outputs')
+    config['profile'] = content['simulation'].getboolean('profile')
+    config['profile_trace'] = content['simulation'].getboolean('profile_trace')
 
     config['num_layers'] = content['model'].getint('num_layers')
     config['width_layers'] = content['model'].getint('width_layers')
@@ -31,8 +46,22 @@ def import_train_configuration(config_file):
     config['fc2_dims'] = content['model'].getint('fc2_dims')
     config['fc3_dims'] = content['model'].getint('fc3_dims')
     config['tau'] = content['model'].getfloat('tau')
+    config['double_dqn'] = content['model'].getboolean('double_dqn')
+    config['target_update_interval'] = content['model'].getint('target_update_interval')
+    config['async_learning'] = content['model'].getboolean('async_learning')
+    config['publish_interval'] = content['model'].getint('publish_interval')
+    config['fused_learning'] = content['model'].getboolean('fused_learning')
+    config['torch_threads'] = content['model'].getint('torch_threads')
+    config['script_policy'] = content['model'].getboolean('script_policy')
     config['min_mem_size'] = content['memory'].getint('min_mem_size')
     config['max_mem_size'] = content['memory'].getint('max_mem_size')
+    config['compact_memory'] = content['memory'].getboolean('compact')
+    config['prioritized_memory'] = content['memory'].getboolean('prioritized')
+    config['alpha'] = content['memory'].getfloat('alpha')
+    config['beta'] = content['memory'].getfloat('beta')
+    config['beta_increment'] = content['memory'].getfloat('beta_increment')
+    config['persistent_memory'] = content['memory'].getboolean('persistent')
+    config['legacy_sampling'] = content['memory'].getboolean('legacy_sampling')
 
     config['num_states'] = content['agent'].getint('num_states')
     config['num_state_veh'] = content['agent'].getint('num_state_veh')
@@ -42,8 +71,18 @@ def import_train_configuration(config_file):
     config['epsilon_end'] = content['agent'].getfloat('epsilon_end')
     config['epsilon_dec'] = content['agent'].getfloat('eps_dec')
 
+    config['checkpoint_interval'] = content['checkpoint'].getint('interval')
+    config['keep_last'] = content['checkpoint'].getint('keep_last')
+    config['keep_best'] = content['checkpoint'].getint('keep_best')
+
     config['models_path_name'] = content['dir']['models_path_name']
     config['sumocfg_file_name'] = content['dir']['sumocfg_file_name']
+    config['memory_path_name'] = content['dir']['memory_path_name']
+    config['route_cache_path_name'] = content['dir']['route_cache_path_name']
+    config['snapshot_path_name'] = content['dir']['snapshot_path_name']
+    # every run of VecSimulation plays n_envs episodes, a last partial batch would train past total_episodes
+    if config['total_episodes'] % config['n_envs']:
+        sys.exit('total_episodes must be a multiple of n_envs')
     return config
 
 
@@ -85,6 +124,61 @@ def set_sumo(gui, sumocfg_file_name, max_steps):
     return sumo_cmd
 
 
+def set_backend(backend, gui=False):
+    """
+    Import the module that drives SUMO: libsumo runs SUMO inside this process, traci talks to it over a socket
+    """
+    if backend == 'libsumo':
+        if gui:
+            print('libsumo can not run sumo-gui, falling back to traci')
+        else:
+            try:
+                import libsumo
+                return libsumo
+            except ImportError:
+                print('libsumo is not available, falling back to traci')
+    import traci
+    return traci
+
+
+def build_network(config):
+    """
+    DeepQNetwork with the layers of the configuration
+    """
+    from ddqn_net import DeepQNetwork
+    return DeepQNetwork(lr=config['lr'], input_dims=config['num_states'], target_input_dims=config['num_states'],
+                        fc1_dims=config['fc1_dims'], fc2_dims=config['fc2_dims'], fc3_dims=config['fc3_dims'],
+                        n_actions=config['num_actions'])
+
+
+def build_simulation(config, **overrides):
+    """
+    Simulation with the parameters of the configuration, a new network, memory and traffic generator and no
+    training epochs, as the benchmarks run it. Any argument of Simulation can be overridden
+    """
+    from simulation import Simulation
+    from gen_vp import TrafficGenerator
+    from memory import Memory
+    params = dict(sumo_cmd=set_sumo(False, config['sumocfg_file_name'], config['max_steps']), gamma=config['gamma'],
+                  max_steps=config['max_steps'], green_duration=config['green_duration'],
+                  ped_green_duration=config['ped_green_duration'], yellow_duration=config['yellow_duration'],
+                  ped_yellow_duration=config['ped_yellow_duration'], num_states=config['num_states'],
+                  num_states_veh=config['num_state_veh'], num_actions=config['num_actions'], training_epochs=0,
+                  batch_size=config['batch_size'], epsilon=config['epsilon'], epsilon_end=config['epsilon_end'],
+                  epsilon_dec=config['epsilon_dec'], tau=config['tau'], max_mem_size=config['max_mem_size'])
+    params.update(overrides)
+    # built only when not given, a memory of max_mem_size transitions is large
+    if 'Model' not in params:
+        params['Model'] = build_network(config)
+    if 'Memory' not in params:
+        params['Memory'] = Memory(state_size=config['num_states'], max_mem_size=params['max_mem_size'], num_act=5)
+    if 'TrafficGen' not in params:
+        params['TrafficGen'] = TrafficGenerator(max_steps=config['max_steps'],
+                                                n_cars_generated=config['n_cars_generated'],
+                                                n_peds_generated=config['n_peds_generated'])
+    return Simulation(**params)
+
+
 def set_train_path(models_path_name):
     """
     Create a new model path with an incremental integer, also considering previously created model paths
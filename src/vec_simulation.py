@@ -0,0 +1,91 @@
+import os
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+import traci
+
+from simulation import Simulation
+
+
+class VecSimulation(Simulation):
+    """
+    Runs n_envs episodes in lockstep, each one in its own sumo instance behind a labeled TraCI connection.
+    The actions of all the environments are chosen with one batched forward pass and every transition
+    goes into the shared memory
+    """
+    def __init__(self, n_envs, **kwargs):
+        if kwargs.get('backend', traci) is not traci:
+            print('libsumo runs a single sumo per process, falling back to traci for', n_envs, 'environments')
+            kwargs['backend'] = traci
+        super(VecSimulation, self).__init__(**kwargs)
+        self._n_envs = n_envs
+        self._policy_batch_size = n_envs
+        self._envs = [Simulation(label='env_' + str(i),
+                                 route_file=os.path.join('intersection', 'episode_routes_env' + str(i) + '.rou.xml'),
+                                 target_model=self.qnet_target,
+                                 **dict(kwargs, async_learning=False, pipeline=False))
+                      for i in range(n_envs)]
+
+    def run(self, episode, epsilon):
+        """
+        Runs the episodes episode, ..., episode + n_envs - 1 in parallel, then starts a training session
+        """
+        start_time = timeit.default_timer()
+
+        # sumo instances are started one after the other to avoid races on the free ports
+        wait_time = 0
+        prep_time = 0
+        for i, env in enumerate(self._envs):
+            wait_time += env._start(episode + i)
+            prep_time += env._prep_time
+        if self._learner is not None:
+            self._learner._start()
+        print("Simulating", self._n_envs, "environments...")
+        simulate_start_time = timeit.default_timer()
+
+        active = list(self._envs)
+        # sumo releases the GIL while stepping, so threads are enough to keep all the instances busy
+        with ThreadPoolExecutor(max_workers=self._n_envs) as pool:
+            while active:
+                observations = list(pool.map(lambda env: env._observe(), active))
+                # the memory is written from this thread only
+                for env, (current_state, reward, reward_veh, reward_ped) in zip(active, observations):
+                    env._remember(current_state, reward, reward_veh, reward_ped)
+                # environments that terminated early are finished before choosing the actions
+                terminated = [env._terminated() for env in active]
+                for env, done in zip(active, terminated):
+                    if done:
+                        env._finish(epsilon)
+                observations = [observation for observation, done in zip(observations, terminated) if not done]
+                active = [env for env, done in zip(active, terminated) if not done]
+                if not active:
+                    break
+                actions = self._choose_actions([observation[0] for observation in observations], epsilon)
+                list(pool.map(lambda env, action: env._act(action), active, actions))
+                for env in active:
+                    if env._step >= env._max_steps:
+                        env._finish(epsilon)
+                active = [env for env in active if env._step < env._max_steps]
+
+        # episode stats are kept in the order of the episodes
+        stats = self._get_episode_stats()
+        for env in self._envs:
+            for key, values in env._get_episode_stats().items():
+                stats[key].append(values[-1])
+        simulate_time = timeit.default_timer() - simulate_start_time
+        simulation_time = round(timeit.default_timer() - start_time, 1)
+        if self._preparer is not None:
+            # the single preparer thread still starts the instances one after the other
+            for i, env in enumerate(self._envs):
+                next_episode = episode + self._n_envs + i
+                if self._has_episode(next_episode):
+                    env._next = (next_episode, self._preparer.submit(env._prepare, next_episode))
+        training_time = self._train()
+        self._save_timings(prep_time, wait_time, simulate_time, training_time)
+        if self._profiler is not None:
+            self._profiler._episode_end(episode)
+
+        return simulation_time, training_time
+
+    def _close_sumo(self):
+        for env in self._envs:
+            env._close_sumo()
@@ -0,0 +1,61 @@
+class WaitTracker:
+    """
+    Waiting times of the agents followed for the reward and their running total. Every update moves the total by
+    the difference of each entry it changes instead of summing all of them, and the agents that left the area
+    they are followed in or arrived are dropped, so that memory is bounded by the agents that are still there.
+    The agents that left are the ones in the area at the previous update and not at this one, so an update costs
+    the agents in the area, not all the tracked ones
+    """
+    def __init__(self):
+        self._waits = {}
+        # agents in the area at the last update
+        self._in_area = {}
+        self.total = 0
+
+    def __len__(self):
+        return len(self._waits)
+
+    def __iter__(self):
+        return iter(self._waits)
+
+    def _set_all(self, waits, visible, drop_unseen=False):
+        """
+        :param waits: dict agent id -> waiting time of the agents in the area, replacing their waiting times
+        :param visible: the agents seen at this update, see _leave
+        """
+        tracked = self._waits
+        total = self.total
+        for agent_id, wait in waits.items():
+            total += wait - tracked.get(agent_id, 0)
+            tracked[agent_id] = wait
+        self.total = total
+        self._leave(dict(waits), visible, drop_unseen)
+
+    def _add_all(self, waits, visible, drop_unseen=False):
+        """
+        :param waits: list of (agent id, waiting time) of the agents in the area, added to their waiting times
+        :param visible: the agents seen at this update, see _leave
+        """
+        tracked = self._waits
+        total = self.total
+        for agent_id, wait in waits:
+            tracked[agent_id] = tracked.get(agent_id, 0) + wait
+            total += wait
+        self.total = total
+        self._leave(dict(waits), visible, drop_unseen)
+
+    def _leave(self, in_area, visible, drop_unseen):
+        """
+        Drop the agents that were in the area at the last update and are seen out of it now. The ones that are
+        not seen at all are kept until they arrive, or dropped with drop_unseen, when arrivals may be missed
+        :param in_area: dict with the agents in the area as keys, kept until the next update
+        """
+        left = self._in_area.keys() - in_area.keys()
+        self._remove_all(left if drop_unseen else [agent_id for agent_id in left if agent_id in visible])
+        self._in_area = in_area
+
+    def _remove_all(self, agent_ids):
+        tracked = self._waits
+        for agent_id in agent_ids:
+            if agent_id in tracked:
+                self.total -= tracked.pop(agent_id)
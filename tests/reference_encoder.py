@@ -0,0 +1,154 @@
+"""
+Reference encoding of the vehicles and pedestrians, as it was before StateEncoder, and random agents to
+compare them on. tests/test_state_encoder.py checks StateEncoder against it, src/bench_state.py times both
+"""
+import numpy as np
+
+# lanes the agents are spread on, including lanes that are not part of the state
+VEH_LANES = ['W2TL_1', 'W2TL_2', 'W2TL_3', 'WW2TL_1', 'WW2TL_2', 'WW2TL_3',
+             'N2TL_1', 'N2TL_2', 'N2TL_3', 'NN2TL_1', 'NN2TL_2', 'NN2TL_3',
+             'E2TL_1', 'E2TL_2', 'E2TL_3', 'EE2TL_1', 'EE2TL_2', 'EE2TL_3',
+             'S2TL_1', 'S2TL_2', 'S2TL_3', 'SS2TL_1', 'SS2TL_2', 'SS2TL_3',
+             'TL2E_1', 'TL2N_2', ':TL_9_0', ':TL_3_0']
+# (lane id, max lane position), the reference encoding raises an IndexError past the last crossing cell
+PED_LANES = [(':TL_w0_0', 15), (':TL_w1_0', 15), (':TL_w2_0', 15), (':TL_w3_0', 15),
+             (':TL_c0_0', 30), (':TL_c1_0', 18), (':TL_c2_0', 30), (':TL_c3_0', 18),
+             ('TL_c0_0', 30), ('TL_c1_0', 18), ('TL_c2_0', 30), ('TL_c3_0', 18), ('TL_c4_0', 18), ('TL_c5_0', 18),
+             ('S2TL_0', 30), ('TL2N_0', 30)]
+
+
+def reference_state(vehicles):
+    """
+    The if/elif encoding of the vehicles as it was in Simulation._get_state
+    """
+    state = np.zeros(80)
+    for lane_id, lane_pos in vehicles:
+        lane_pos = 100 - lane_pos
+        if lane_pos < 5:
+            lane_cell = 0
+        elif lane_pos < 10:
+            lane_cell = 1
+        elif lane_pos < 15:
+            lane_cell = 2
+        elif lane_pos < 20:
+            lane_cell = 3
+        elif lane_pos < 25:
+            lane_cell = 4
+        elif lane_pos < 35:
+            lane_cell = 5
+        elif lane_pos < 45:
+            lane_cell = 6
+        elif lane_pos < 65:
+            lane_cell = 7
+        elif lane_pos < 85:
+            lane_cell = 8
+        elif lane_pos < 100:
+            lane_cell = 9
+        else:
+            lane_cell = -1
+
+        if lane_id == "W2TL_1" or lane_id == "W2TL_2" or lane_id == "WW2TL_1" or lane_id == "WW2TL_2":
+            lane_group = 0
+        elif lane_id == "W2TL_3" or lane_id == "WW2TL_3":
+            lane_group = 1
+        elif lane_id == "N2TL_1" or lane_id == "N2TL_2" or lane_id == "NN2TL_1" or lane_id == "NN2TL_2":
+            lane_group = 2
+        elif lane_id == "N2TL_3" or lane_id == "NN2TL_3":
+            lane_group = 3
+        elif lane_id == "E2TL_1" or lane_id == "E2TL_2" or lane_id == "EE2TL_1" or lane_id == "EE2TL_2":
+            lane_group = 4
+        elif lane_id == "E2TL_3" or lane_id == "EE2TL_3":
+            lane_group = 5
+        elif lane_id == "S2TL_1" or lane_id == "S2TL_2" or lane_id == "SS2TL_1" or lane_id == "SS2TL_2":
+            lane_group = 6
+        elif lane_id == "S2TL_3" or lane_id == "SS2TL_3":
+            lane_group = 7
+        else:
+            lane_group = -1
+
+        if lane_group >= 1 and lane_group <= 7:
+            car_position = int(str(lane_group) + str(lane_cell))
+            valid_car = True
+        elif lane_group == 0:
+            car_position = lane_cell
+            valid_car = True
+        else:
+            valid_car = False
+
+        if valid_car:
+            state[car_position] = 1
+    state = list(map(int, state))
+    return state
+
+
+def reference_ped_state(persons):
+    """
+    The if/elif encoding of the pedestrians as it was in Simulation._get_ped_state
+    """
+    w_state = np.zeros((4, 10))
+    c_state = np.zeros((4, 9))
+    xc_state = np.zeros((2, 15))
+    for lane_id, lane_pos in persons:
+        lane_cell = int(lane_pos // 2)
+        lane_cell_wait = int(lane_pos // 1)
+        if lane_cell_wait >= 10:
+            lane_cell_wait = 9
+        if 'TL_w' in lane_id:
+            if 'TL_w0_0' in lane_id:
+                lane_group = 0
+            elif 'TL_w1_0' in lane_id:
+                lane_group = 1
+            elif 'TL_w2_0' in lane_id:
+                lane_group = 2
+            elif 'TL_w3_0' in lane_id:
+                lane_group = 3
+            else:
+                lane_group = -1
+            for lg in range(4):
+                if lane_group == lg:
+                    if 0 <= lane_cell_wait <= 10:
+                        w_state[lg][lane_cell_wait] = 1
+        if lane_id in ['TL_c1_0', 'TL_c3_0', 'TL_c4_0', 'TL_c5_0']:
+            if 'TL_c1_0' in lane_id:
+                lane_group_c = 0
+            elif 'TL_c3_0' in lane_id:
+                lane_group_c = 1
+            elif 'TL_c4_0' in lane_id:
+                lane_group_c = 2
+            elif 'TL_c5_0' in lane_id:
+                lane_group_c = 3
+            else:
+                lane_group_c = -1
+            for clg in range(4):
+                if lane_group_c == clg:
+                    if 0 <= lane_cell <= 9:
+                        c_state[clg][lane_cell] = 1
+        if lane_id in ['TL_c0_0', 'TL_c2_0']:
+            if 'TL_c0_0' in lane_id:
+                lane_group_xc = 0
+            elif 'TL_c2_0' in lane_id:
+                lane_group_xc = 1
+            else:
+                lane_group_xc = -1
+            for clg in range(2):
+                if lane_group_xc == clg:
+                    if 0 <= lane_cell <= 15:
+                        xc_state[clg][lane_cell] = 1
+
+    w_state = list(map(int, w_state.flatten()))
+    c_state = list(map(int, c_state.flatten()))
+    xc_state = list(map(int, xc_state.flatten()))
+    return w_state + c_state + xc_state
+
+
+def random_agents(rng, n_veh, n_ped):
+    """
+    Vehicles and pedestrians at random positions of the scenario lanes
+    """
+    vehicles = [(VEH_LANES[k], pos) for k, pos in zip(rng.integers(len(VEH_LANES), size=n_veh),
+                                                       rng.uniform(0.01, 98.5, size=n_veh))]
+    persons = []
+    for k, u in zip(rng.integers(len(PED_LANES), size=n_ped), rng.uniform(-0.5, 1, size=n_ped)):
+        lane_id, max_pos = PED_LANES[k]
+        persons.append((lane_id, float(u * max_pos)))
+    return vehicles, persons
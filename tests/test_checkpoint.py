@@ -0,0 +1,32 @@
+from checkpoint import Checkpointer
+
+
+class FakeSimulation:
+    def _training_state(self):
+        return {}
+
+    def _get_episode_stats(self):
+        return {'reward': [-1.0]}
+
+
+class FakeMemory:
+    def _state_dict(self):
+        return {}
+
+
+def saved_episodes(tmp_path, episodes, interval, n_envs):
+    checkpointer = Checkpointer(str(tmp_path), interval=interval, keep_last=100, keep_best=0)
+    episode = 0
+    while episode < episodes:
+        episode += n_envs
+        checkpointer._save(episode, 0.5, FakeSimulation(), FakeMemory(), final=episode >= episodes)
+    checkpointer._close()
+    return sorted(entry[0] for entry in checkpointer._index.values())
+
+
+def test_every_interval_is_saved_when_episodes_skip_its_multiples(tmp_path):
+    assert saved_episodes(tmp_path, episodes=30, interval=10, n_envs=4) == [12, 20, 32]
+
+
+def test_final_episode_is_saved_once(tmp_path):
+    assert saved_episodes(tmp_path, episodes=30, interval=10, n_envs=1) == [10, 20, 30]
@@ -0,0 +1,30 @@
+import os
+
+from utils import import_train_configuration, build_network
+from fake_traci import FakeTraci, synthetic_frames
+from controller import Controller
+
+SIM_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'sim.ini')
+
+
+def attached_controller(config, conn):
+    return Controller(conn, build_network(config), deadline=1.0, green_duration=config['green_duration'],
+                      ped_green_duration=config['ped_green_duration'], yellow_duration=config['yellow_duration'],
+                      ped_yellow_duration=config['ped_yellow_duration'], num_states_veh=config['num_state_veh'],
+                      num_states=config['num_states'], num_fixed_actions=config['num_actions'] - 1)
+
+
+def test_attached_controller_sees_the_agents_and_counts_from_attach_time():
+    config = import_train_configuration(config_file=SIM_INI)
+    conn = FakeTraci(synthetic_frames(200, 100))
+    conn.start(['sumo'])
+    conn.simulationStep(100)
+    controller = attached_controller(config, conn)
+    encoded = []
+    encode_veh = controller._encoder.encode_veh
+    controller._encoder.encode_veh = lambda vehicles: encoded.append(len(vehicles)) or encode_veh(vehicles)
+    latencies = controller.run(60, attached=True)
+    # the first decision is made on the agents already there, before any step of the controller
+    assert encoded[0] == 200
+    assert latencies[0]['time'] == 100
+    assert conn.simulation.getTime() == 160
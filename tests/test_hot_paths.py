@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils import import_train_configuration
+from fake_traci import synthetic_frames
+from bench_hot_paths import HOT_PATHS, fake_simulation, bench_method, regressions
+
+SIM_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'sim.ini')
+ROUNDS = 30
+# ten times the agents may cost up to twice ten times the time, a quadratic path costs about a hundred times
+MAX_SCALING = 20
+# median per call with 1000 agents, about 0.4 ms on a laptop core, the margin is for slow CI machines
+MAX_MEDIAN_S = 5e-3
+
+
+@pytest.fixture(scope='module')
+def medians(tmp_path_factory):
+    """
+    Median latency of every hot path with 100 and 1000 agents on a FakeTraci
+    """
+    config = import_train_configuration(config_file=SIM_INI)
+    route_file = str(tmp_path_factory.mktemp('routes') / 'routes.rou.xml')
+    result = {}
+    for n in [100, 1000]:
+        simulation = fake_simulation(config, synthetic_frames(n - n // 3, n // 3), route_file)
+        for method in HOT_PATHS:
+            result.setdefault(method, {})[n] = float(np.median(bench_method(simulation, method, ROUNDS)))
+    return result
+
+
+@pytest.mark.parametrize('method', HOT_PATHS)
+def test_hot_path_scales_linearly(medians, method):
+    assert medians[method][1000] / medians[method][100] < MAX_SCALING
+
+
+@pytest.mark.parametrize('method', HOT_PATHS)
+def test_hot_path_latency(medians, method):
+    assert medians[method][1000] < MAX_MEDIAN_S
+
+
+def test_regressions_against_baseline():
+    baseline = {'_get_state': {'100': {'median_us': 100.0}, '1000': {'median_us': 400.0}}}
+    results = {'_get_state': {100: {'median_us': 120.0}, 1000: {'median_us': 600.0}},
+               '_get_ped_state': {100: {'median_us': 50.0}}}
+    slower = regressions(results, baseline, tolerance=0.25)
+    assert len(slower) == 1 and slower[0].startswith('_get_state with 1000 agents')
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from memory import Memory
+
+
+def filled_memory(transitions, **kwargs):
+    memory = Memory(state_size=4, max_mem_size=100, num_act=5, **kwargs)
+    state = np.zeros(4, dtype=np.int32)
+    for k in range(transitions):
+        memory._store_transition(state, state, k % 5, -k, -k, 0)
+    return memory
+
+
+def test_sample_draws_distinct_indices_of_stored_transitions():
+    memory = filled_memory(150)
+    np.random.seed(0)
+    for _ in range(200):
+        batch, weights = memory._sample(64)
+        assert weights is None
+        assert len(np.unique(batch)) == 64
+        assert batch.min() >= 0 and batch.max() < 100
+
+
+def test_sample_of_a_full_batch_falls_back_to_a_permutation():
+    memory = filled_memory(64)
+    np.random.seed(0)
+    batch, _ = memory._sample(64)
+    assert sorted(batch) == list(range(64))
+
+
+def test_legacy_sampling_reproduces_random_choice():
+    memory = filled_memory(80, legacy_sampling=True)
+    np.random.seed(1)
+    batch, _ = memory._sample(32)
+    np.random.seed(1)
+    assert np.array_equal(batch, np.random.choice(80, 32, replace=False))
+
+
+def test_reopening_a_memory_of_another_size_raises(tmp_path):
+    Memory(state_size=4, max_mem_size=100, num_act=5, path=str(tmp_path))
+    with pytest.raises(ValueError):
+        Memory(state_size=4, max_mem_size=200, num_act=5, path=str(tmp_path))
@@ -0,0 +1,20 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils import import_train_configuration, build_network
+from policy import GreedyPolicy
+
+SIM_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'sim.ini')
+
+
+@pytest.mark.parametrize('script', [False, True])
+def test_batched_actions_match_single_ones(script):
+    network = build_network(import_train_configuration(config_file=SIM_INI))
+    policy = GreedyPolicy(network, script=script, batch_size=4)
+    states = list(np.random.default_rng(0).integers(0, 2, size=(4, network.input_dims), dtype=np.uint8))
+    single = [policy._act(state) for state in states]
+    assert list(policy._act_batch(states)) == single
+    # fewer states than environments, when some of them terminated early
+    assert list(policy._act_batch(states[:3])) == single[:3]
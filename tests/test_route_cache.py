@@ -0,0 +1,34 @@
+import os
+
+from gen_vp import TrafficGenerator
+from route_cache import RouteCache, ROUTE_FILE_PATTERN
+
+
+def route_files(path):
+    return sorted(name for name in os.listdir(path) if ROUTE_FILE_PATTERN.match(name))
+
+
+def test_generators_with_other_parameters_get_other_files(tmp_path):
+    files = set()
+    for max_steps, cars, peds in [(5400, 10, 20), (3600, 10, 20), (5400, 20, 20), (5400, 10, 30)]:
+        cache = RouteCache(TrafficGenerator(max_steps, cars, peds), str(tmp_path), lookahead=0, max_size=10)
+        files.add(cache._get(0)[0])
+        cache._close()
+    assert len(files) == 4
+
+
+def test_files_of_earlier_runs_count_towards_max_size(tmp_path):
+    cache = RouteCache(TrafficGenerator(5400, 10, 20), str(tmp_path), lookahead=0, max_size=5)
+    for seed in range(5):
+        cache._get(seed)
+    cache._close()
+    assert len(route_files(tmp_path)) == 5
+    # last use of every seed, the earliest first
+    for name in route_files(tmp_path):
+        seed = int(ROUTE_FILE_PATTERN.match(name).group(1))
+        os.utime(os.path.join(tmp_path, name), (1000 + seed, 1000 + seed))
+
+    cache = RouteCache(TrafficGenerator(5400, 10, 20), str(tmp_path), lookahead=0, max_size=2)
+    cache._close()
+    assert [int(ROUTE_FILE_PATTERN.match(name).group(1)) for name in route_files(tmp_path)] == [3, 4]
+    assert len(os.listdir(tmp_path)) == 4
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from state_encoder import StateEncoder, VEH_STATES
+from reference_encoder import reference_state, reference_ped_state, random_agents
+
+
+def test_matches_reference_encoding():
+    rng = np.random.default_rng(0)
+    encoder = StateEncoder()
+    for _ in range(500):
+        vehicles, persons = random_agents(rng, rng.integers(0, 300), rng.integers(0, 150))
+        state = encoder.encode(vehicles, persons)
+        assert state.dtype == np.uint8
+        assert state.tolist() == reference_state(vehicles) + reference_ped_state(persons)
+
+
+def test_car_at_lane_start_is_dropped():
+    # 100 m from the traffic light is past the last cell. The reference wrote a car of the W lanes there into
+    # state[-1], the last cell of the S left turn lanes, and failed on the other lanes
+    assert reference_state([('W2TL_1', 0.0)])[VEH_STATES - 1] == 1
+    with pytest.raises(ValueError):
+        reference_state([('N2TL_1', 0.0)])
+    encoder = StateEncoder()
+    assert not encoder.encode([('W2TL_1', 0.0)], []).any()
+    assert not encoder.encode([('N2TL_1', 0.0)], []).any()
+
+
+def test_car_just_past_lane_start_is_in_last_cell():
+    encoder = StateEncoder()
+    state = encoder.encode([('W2TL_1', 1e-9)], [])
+    assert state.tolist() == reference_state([('W2TL_1', 1e-9)]) + [0] * (len(state) - VEH_STATES)
+    assert state[9] == 1
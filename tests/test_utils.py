@@ -0,0 +1,24 @@
+import configparser
+import os
+
+import pytest
+
+from utils import import_train_configuration
+
+SIM_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'sim.ini')
+
+
+def test_n_envs_must_divide_total_episodes(tmp_path):
+    content = configparser.ConfigParser()
+    content.read(SIM_INI)
+    content['simulation']['total_episodes'] = '10'
+    content['simulation']['n_envs'] = '4'
+    config_file = str(tmp_path / 'sim.ini')
+    with open(config_file, 'w') as f:
+        content.write(f)
+    with pytest.raises(SystemExit):
+        import_train_configuration(config_file=config_file)
+    content['simulation']['n_envs'] = '5'
+    with open(config_file, 'w') as f:
+        content.write(f)
+    assert import_train_configuration(config_file=config_file)['n_envs'] == 5
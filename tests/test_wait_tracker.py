@@ -0,0 +1,28 @@
+from wait_tracker import WaitTracker
+
+
+def test_total_follows_the_entries():
+    tracker = WaitTracker()
+    tracker._set_all({'a': 3, 'b': 5}, {'a', 'b'})
+    tracker._set_all({'a': 4, 'c': 1}, {'a', 'b', 'c'})
+    # b is seen out of the area
+    assert dict(tracker._waits) == {'a': 4, 'c': 1}
+    assert tracker.total == 5
+    tracker._remove_all(['c', 'unknown'])
+    assert tracker.total == sum(tracker._waits.values()) == 4
+
+
+def test_unseen_agents_are_kept_until_they_arrive():
+    tracker = WaitTracker()
+    tracker._add_all([('p', 2), ('q', 1)], {'p', 'q'})
+    tracker._add_all([('p', 3)], {'p'})
+    assert dict(tracker._waits) == {'p': 5, 'q': 1}
+    assert tracker.total == 6
+
+
+def test_unseen_agents_are_dropped_when_arrivals_may_be_missed():
+    tracker = WaitTracker()
+    tracker._add_all([('p', 2), ('q', 1)], {'p', 'q'}, drop_unseen=True)
+    tracker._add_all([('p', 3)], {'p'}, drop_unseen=True)
+    assert dict(tracker._waits) == {'p': 5}
+    assert tracker.total == 5